@@ -1,21 +1,34 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import logging
 import json
 import getpass
 import os
 import requests
-from datetime import datetime
+from datetime import datetime, timedelta
 import zipfile
+import zlib
 import re
 from urllib.parse import urlparse, parse_qs
 from pathlib import Path
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from download_settings import load_settings
+from listing_parser import parse_csv_links, parse_inputs, find_csv_links_per_row
+from file_catalog import get_catalog, parse_csv_filename, CSV_TIMESTAMP_FORMAT, DOWNLOADED
+
+# Selenium is only needed when the login over plain HTTP fails
+try:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+except ImportError:
+    webdriver = None
 
 # Ensure paths are absolute
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -30,6 +43,10 @@ if os.path.exists(FILES_PATH):
                 download_csv_json_path = file_path_data["CSV"]["csv_files"]
                 xpath_json_path = file_path_data["JSON"]["x_path"]
                 zip_csv_json_path = file_path_data["CSV"]["zip_csv"]
+                # Kept outside the project folder unless file_path.json names a file
+                session_json_path = file_path_data["JSON"].get("session")
+                sync_state_json_path = file_path_data["JSON"]["sync_state"]
+                retry_queue_json_path = file_path_data["JSON"]["retry_queue"]
             except json.JSONDecodeError:
                 print("\nfile_path.json existed but unable to load files.")
 else:
@@ -38,6 +55,16 @@ else:
 credentials_file = os.path.join(BASE_DIR, credentials_file_json_path)
 csv_path_link = os.path.join(BASE_DIR, csv_path_link_json_path)
 tiny_file_manager_url = os.path.join(BASE_DIR, url_json_path)
+def default_session_cache_file():
+    """Session cache in the user's cache folder, away from the files shared with the project."""
+    cache_root = (os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME')
+                  or os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_root, 'Tiny-File-Manager', 'session.json')
+
+session_cache_file = (os.path.join(BASE_DIR, session_json_path) if session_json_path
+                      else default_session_cache_file())
+sync_state_file = os.path.join(BASE_DIR, sync_state_json_path)
+retry_queue_file = os.path.join(BASE_DIR, retry_queue_json_path)
 
 print(f"Credential file path: {credentials_file}")
 print(f"CSV Link file path: {csv_path_link}")
@@ -149,22 +176,114 @@ def login_with_selenium(username, password, browser):
         logging.error(f"Login failed: {e}")
         return None
 
+# Form fields of the Tiny File Manager login page
+LOGIN_FIELDS = {"username": "fm_usr", "password": "fm_pwd", "token": "token"}
+
+# Reuse the cached login for this long before logging in again
+SESSION_TTL_SECONDS = float(load_settings()["session_ttl_minutes"]) * 60
+
+def is_login_page(html):
+    return LOGIN_FIELDS["password"] in parse_inputs(html)
+
+def login_with_http(http_session, username, password):
+    """Log in by posting the login form directly, returning the token or None when it fails."""
+    try:
+        page = http_session.get(TINY_FILE_MANAGER, timeout=30)
+        page.raise_for_status()
+        token = parse_inputs(page.text).get(LOGIN_FIELDS["token"])
+        if not token:
+            logging.warning("Login token not found on the login page")
+            return None
+
+        response = http_session.post(TINY_FILE_MANAGER, timeout=30, data={
+            LOGIN_FIELDS["username"]: username,
+            LOGIN_FIELDS["password"]: password,
+            LOGIN_FIELDS["token"]: token,
+        })
+        if response.status_code != 200 or is_login_page(response.text):
+            logging.warning(f"Login over HTTP failed: HTTP {response.status_code}")
+            return None
+
+        logging.info("Login over HTTP successful")
+        return token
+    except requests.RequestException as e:
+        logging.warning(f"Login over HTTP failed: {e}")
+        return None
+
+def get_listing_with_http(http_session):
+    """HTML of the file listing, or None when the session is not logged in."""
+    try:
+        response = http_session.get(TINY_FILE_MANAGER, timeout=30)
+        if response.status_code != 200 or is_login_page(response.text):
+            return None
+        return response.text
+    except requests.RequestException as e:
+        logging.warning(f"Unable to load the file listing: {e}")
+        return None
+
+def load_session_cache():
+    """Token and cookies of the last login, or None when missing or older than SESSION_TTL_SECONDS."""
+    if not os.path.exists(session_cache_file):
+        return None
+    with open(session_cache_file, 'r') as file:
+        try:
+            session = json.load(file)
+        except json.JSONDecodeError:
+            return None
+    if session.get("url") != TINY_FILE_MANAGER or time.time() - session.get("saved_at", 0) > SESSION_TTL_SECONDS:
+        return None
+    return session
+
+def save_session_cache(token, cookies):
+    session = {"url": TINY_FILE_MANAGER, "token": token, "cookies": cookies, "saved_at": time.time()}
+    os.makedirs(os.path.dirname(session_cache_file), exist_ok=True)
+    # Readable by the user only, it logs in as them
+    descriptor = os.open(session_cache_file + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w') as file:
+        json.dump(session, file, indent=4)
+    os.replace(session_cache_file + '.tmp', session_cache_file)
+
+def start_http_session(username, password):
+    """
+    Log in without a browser, reusing the cached session while it is valid.
+
+    Returns:
+    - tuple: (token, session cookies, CSV file links), or None to fall back to Selenium.
+    """
+    http_session = requests.Session()
+
+    cached = load_session_cache()
+    if cached:
+        http_session.cookies.update(cached["cookies"])
+        listing = get_listing_with_http(http_session)
+        if listing is not None:
+            logging.info("Reusing the cached login")
+            return cached["token"], cached["cookies"], parse_csv_links(listing, TINY_FILE_MANAGER, csv_files_xpath)
+        http_session.cookies.clear()
+
+    token = login_with_http(http_session, username, password)
+    if not token:
+        return None
+    listing = get_listing_with_http(http_session)
+    if listing is None:
+        return None
+
+    cookies = http_session.cookies.get_dict()
+    save_session_cache(token, cookies)
+    return token, cookies, parse_csv_links(listing, TINY_FILE_MANAGER, csv_files_xpath)
+
 # Function to get CSV file links from the file management page
 def get_csv_files(browser):
+    # Parse the page source once instead of one WebDriver lookup per row
     csv_files = []
     try:
-        rows = browser.find_elements(By.XPATH, csv_files_xpath)
-        for row in rows:
-            try:
-                # Locate the <i> element and extract the link
-                i_element = row.find_element(By.XPATH, './td[6]/a[2]')
-                link = i_element.get_attribute('href')
-                if link and link.endswith('.csv'):
-                    csv_files.append(link)
-            except Exception as e:
-                logging.warning(f"Error finding CSV link in row: {e}")
+        csv_files = parse_csv_links(browser.page_source, browser.current_url, csv_files_xpath)
     except Exception as e:
-        logging.error(f"Error retrieving CSV files: {e}")
+        logging.error(f"Error parsing the file listing: {e}")
+
+    if not csv_files:
+        logging.warning("No CSV files found in the page source, looking them up row by row")
+        csv_files = find_csv_links_per_row(browser, csv_files_xpath)
     return csv_files
 
 # Function to save CSV links and token to a JSON file
@@ -173,8 +292,19 @@ def save_csv_links_to_json(csv_files, token):
         "token": token,
         "csv_files": csv_files
     }
+
+    # Leave the file untouched when the listing and token did not change
+    if os.path.exists(csv_path_link):
+        with open(csv_path_link, 'r') as file:
+            try:
+                if json.load(file) == data:
+                    return False
+            except json.JSONDecodeError:
+                pass
+
     with open(csv_path_link, 'w') as file:
         json.dump(data, file, indent=4)
+    return True
 
 # Function to extract the filename from a URL
 def extract_filename_from_url(url):
@@ -191,47 +321,369 @@ def get_session_cookies(browser):
     session_cookies = {cookie['name']: cookie['value'] for cookie in cookies}
     return session_cookies
 
-# Preload all filenames (including those in subdirectories)
-existing_files = set()
-for root, _, files in os.walk(download_dir):
-    for file in files:
-        existing_files.add(file)  # Add only the filenames (not full paths)
-
-def download_csv_files(csv_files, download_dir, token, browser, username, password, session_cookies):
-    for url in csv_files:
-        try:
-            filename = extract_filename_from_url(url)
-            filepath = os.path.join(download_dir, filename)
+# Only schedule files newer than the watermark of their lift ("incremental_sync": false checks every file)
+INCREMENTAL_SYNC = load_settings()["incremental_sync"]
 
-            # Check if the file is in the preloaded set
-            if filename in existing_files:
-                logging.info(f"{filename} already exists. Skipping download.")
+def load_sync_state():
+    """Newest TO_ timestamp downloaded for each lift, {'lifts': {lift: {'watermark': ...}}}."""
+    if os.path.exists(sync_state_file):
+        with open(sync_state_file, 'r') as file:
+            try:
+                return json.load(file)
+            except json.JSONDecodeError:
+                print("\nsync_state.json existed but unable to load files. Checking every file.")
+    return {"lifts": {}}
+
+def save_sync_state(state):
+    # Write to a temporary file first so an interrupted run never leaves a partial state
+    with open(sync_state_file + '.tmp', 'w') as file:
+        json.dump(state, file, indent=4)
+    os.replace(sync_state_file + '.tmp', sync_state_file)
+
+def is_downloaded(filename):
+    """Whether a CSV file was already downloaded, by the file catalog (also after removal as a duplicate)."""
+    return get_catalog().is_known(filename)
+
+class SyncWatermark:
+    """
+    Per lift watermark of the newest file downloaded.
+
+    Files of a lift are scheduled in date order, and the watermark only
+    moves over the files that finished without a gap, so a failed file is
+    scheduled again on the next run even when later files succeeded.
+    """
+
+    def __init__(self, csv_files):
+        self.state = load_sync_state()
+        self.pending = {}
+        self.finished = {}
+        self.scheduled = []
+        self.skipped = 0
+
+        dated = []
+        for url in csv_files:
+            parsed = parse_csv_filename(extract_filename_from_url(url))
+            if parsed is None:
+                # Names outside the naming are always checked against the download folder
+                self.scheduled.append(url)
                 continue
 
-            # Attempt download with session cookies
-            response = requests.post(url, data={"token": token}, cookies=session_cookies)
-
-            # If unauthorized, re-login and retry
-            if response.status_code == 401:
-                logging.warning("Session expired, re-logging in")
-                token = login_with_selenium(username, password, browser)
-                session_cookies = get_session_cookies(browser)
-                response = requests.post(url, data={"token": token}, cookies=session_cookies)
-
-            if response.status_code == 200:
-                with open(filepath, 'wb') as file:
-                    file.write(response.content)
-                logging.info(f"Downloaded {filename}")
+            lift, end = parsed
+            watermark = self.state["lifts"].get(lift, {}).get("watermark")
+            if watermark and end <= datetime.strptime(watermark, CSV_TIMESTAMP_FORMAT):
+                self.skipped += 1
+                continue
+            dated.append((lift, end, url))
+
+        for lift, end, url in sorted(dated):
+            self.pending.setdefault(lift, []).append((end, url))
+            self.scheduled.append(url)
+
+    def finish(self, url, success):
+        """Record a finished file and save the state when the watermark of its lift moved."""
+        parsed = parse_csv_filename(extract_filename_from_url(url))
+        if parsed is None or not success:
+            return
+
+        lift, _ = parsed
+        self.finished[url] = True
+        pending = self.pending.get(lift, [])
+        newest = None
+        while pending and self.finished.get(pending[0][1]):
+            newest = pending.pop(0)[0]
+
+        if newest is not None:
+            self.state["lifts"].setdefault(lift, {})["watermark"] = newest.strftime(CSV_TIMESTAMP_FORMAT)
+            save_sync_state(self.state)
+
+# Wait retry_base_minutes after the first failure of a file, doubling up to retry_max_minutes
+RETRY_BASE_SECONDS = float(load_settings()["retry_base_minutes"]) * 60
+RETRY_MAX_SECONDS = float(load_settings()["retry_max_minutes"]) * 60
+# A file failing this many runs in a row is not tried again
+RETRY_MAX_ATTEMPTS = max(1, int(load_settings()["retry_max_attempts"]))
+# Answers meaning the link itself is broken, so retrying cannot help
+PERMANENT_HTTP_STATUSES = {404, 410}
+
+def load_retry_queue():
+    """Failed downloads, {'urls': {url: {'attempts', 'last_error', 'next_attempt_at', 'permanent', ...}}}."""
+    if os.path.exists(retry_queue_file):
+        with open(retry_queue_file, 'r') as file:
+            try:
+                return json.load(file)
+            except json.JSONDecodeError:
+                print("\nretry_queue.json existed but unable to load files. Starting an empty queue.")
+    return {"urls": {}}
+
+def save_retry_queue(queue):
+    # Write to a temporary file first so an interrupted run never leaves a partial queue
+    with open(retry_queue_file + '.tmp', 'w') as file:
+        json.dump(queue, file, indent=4)
+    os.replace(retry_queue_file + '.tmp', retry_queue_file)
+
+class RetryQueue:
+    """
+    Persistent queue of the downloads that failed, with exponential backoff.
+
+    Queued files are tried first once their backoff has passed, files still
+    waiting are left for a later run, and files marked permanent (a 404 or
+    410, or RETRY_MAX_ATTEMPTS failures) are not requested again. Remove a
+    file from retry_queue.json to try it again.
+    """
+
+    def __init__(self):
+        self.queue = load_retry_queue()
+        self.entries = self.queue["urls"]
+
+    def backoff_seconds(self, attempts):
+        return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+    def is_permanent(self, url):
+        return self.entries.get(url, {}).get("permanent", False)
+
+    def forget_unlisted(self, csv_files):
+        """Drop the files the server no longer lists."""
+        listed = set(csv_files)
+        unlisted = [url for url in self.entries if url not in listed]
+        for url in unlisted:
+            del self.entries[url]
+        if unlisted:
+            save_retry_queue(self.queue)
+
+    def schedule(self, csv_files, new_files):
+        """
+        Order the queued retries that are due first, then the new files, leaving
+        out those still waiting for their backoff and the permanently broken ones.
+
+        Parameters:
+        - csv_files (list): Every file listed on the server.
+        - new_files (list): The files to download otherwise, e.g. those newer than the sync watermark.
+
+        Returns:
+        - tuple: (scheduled URLs, URLs waiting for their backoff, permanently broken URLs)
+        """
+        now = datetime.now()
+        fresh = [url for url in new_files if url not in self.entries]
+        due, waiting, permanent = [], [], []
+        for url in csv_files:
+            entry = self.entries.get(url)
+            if entry is None:
+                continue
+            if entry.get("permanent"):
+                permanent.append(url)
+            elif datetime.fromisoformat(entry["next_attempt_at"]) > now:
+                waiting.append(url)
             else:
-                logging.error(f"Failed to download {url}: HTTP {response.status_code}")
+                due.append(url)
+        due.sort(key=lambda url: self.entries[url]["next_attempt_at"])
+        return due + fresh, waiting, permanent
+
+    def finish(self, result):
+        """Record the result of a file, saving the queue when it changed."""
+        url = result['url']
+        if result['status'] != 'failed':
+            if self.entries.pop(url, None) is not None:
+                save_retry_queue(self.queue)
+            return
+
+        now = datetime.now()
+        entry = self.entries.setdefault(url, {"filename": result['filename'], "attempts": 0})
+        entry["attempts"] += 1
+        entry["last_error"] = result.get('error')
+        entry["last_attempt_at"] = now.isoformat(timespec='seconds')
+        entry["next_attempt_at"] = (now + timedelta(seconds=self.backoff_seconds(entry["attempts"]))).isoformat(
+            timespec='seconds')
+        entry["permanent"] = (result.get('status_code') in PERMANENT_HTTP_STATUSES
+                              or entry["attempts"] >= RETRY_MAX_ATTEMPTS)
+        if entry["permanent"]:
+            logging.warning(f"Giving up on {result['filename']} after {entry['attempts']} attempts: {entry['last_error']}")
+        save_retry_queue(self.queue)
+
+# Number of files downloaded at the same time over one pooled session
+DOWNLOAD_WORKERS = max(1, int(load_settings()["download_workers"]))
+
+class DownloadSession:
+    """
+    Pooled HTTP session shared by the download workers.
+
+    Connections are kept alive across files. When the server answers 401,
+    only the first worker logs in again through the browser; workers that
+    hit the same expired login wait for it and retry with the new token.
+    """
+
+    def __init__(self, token, browser, username, password, session_cookies, workers):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.cookies.update(session_cookies)
+
+        self.token = token
+        self.browser = browser
+        self.username = username
+        self.password = password
+        self.login_count = 0
+        self.lock = threading.Lock()
+
+    def credentials(self):
+        """Token and login count to send a request with."""
+        with self.lock:
+            return self.token, self.login_count
+
+    def relogin(self, login_count):
+        """Log in again, unless another worker already did since login_count was read."""
+        with self.lock:
+            if self.login_count == login_count:
+                logging.warning("Session expired, re-logging in")
+                if self.browser is not None:
+                    self.token = login_with_selenium(self.username, self.password, self.browser)
+                    self.session.cookies.update(get_session_cookies(self.browser))
+                else:
+                    # Logged in without a browser, so log in over HTTP again
+                    http_session = requests.Session()
+                    self.token = login_with_http(http_session, self.username, self.password)
+                    if self.token:
+                        self.session.cookies.update(http_session.cookies.get_dict())
+                        save_session_cache(self.token, http_session.cookies.get_dict())
+                self.login_count += 1
+
+    def post(self, url, headers=None, stream=False):
+        token, login_count = self.credentials()
+        response = self.session.post(url, data={"token": token}, headers=headers, stream=stream)
+
+        # If unauthorized, re-login once and retry
+        if response.status_code == 401:
+            response.close()
+            self.relogin(login_count)
+            token, _ = self.credentials()
+            response = self.session.post(url, data={"token": token}, headers=headers, stream=stream)
+        return response
+
+# Partial downloads are written next to the final file and renamed into place once complete
+PART_SUFFIX = '.part'
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+DOWNLOAD_ATTEMPTS = max(1, int(load_settings()["download_attempts"]))
+
+def expected_file_size(response, offset):
+    """
+    Full size of the file being sent, or None when the server does not tell it.
+
+    A 206 response must continue exactly at offset, otherwise a ValueError
+    is raised so the partial file is not corrupted.
+    """
+    if response.status_code == 206:
+        match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', response.headers.get('Content-Range', ''))
+        if not match or int(match.group(1)) != offset:
+            raise ValueError(f"unexpected Content-Range {response.headers.get('Content-Range')!r}")
+        return int(match.group(2)) if match.group(2) != '*' else None
+
+    # Content-Length of a compressed response does not match the decoded file
+    content_length = response.headers.get('Content-Length')
+    if content_length is None or response.headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+    return int(content_length)
+
+def stream_to_part_file(dl_session, url, part_path):
+    """
+    Stream a download into part_path, resuming it with a Range request when it exists.
+
+    Returns:
+    - tuple: (HTTP status, bytes received, whether part_path now holds the whole file)
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else None
+
+    with dl_session.post(url, headers=headers, stream=True) as response:
+        if response.status_code == 416:
+            # The partial file does not match the file on the server any more
+            os.remove(part_path)
+            return response.status_code, 0, False
+        if response.status_code not in (200, 206):
+            return response.status_code, 0, False
+
+        if response.status_code == 200:
+            # The server ignored the Range header and sends the whole file
+            offset = 0
+        try:
+            expected_size = expected_file_size(response, offset)
+        except ValueError:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+        received = 0
+        with open(part_path, 'ab' if offset else 'wb') as file:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                file.write(chunk)
+                received += len(chunk)
+
+    size = os.path.getsize(part_path)
+    complete = expected_size is None or size == expected_size
+    if not complete:
+        logging.warning(f"Incomplete download of {url}: {size} of {expected_size} bytes")
+    return response.status_code, received, complete
+
+def download_csv_file(dl_session, url, download_dir):
+    """Download one CSV file, returning its status, bytes and seconds."""
+    filename = extract_filename_from_url(url)
+    filepath = os.path.join(download_dir, filename)
+    result = {'url': url, 'filename': filename, 'status': 'failed', 'bytes': 0, 'seconds': 0.0}
+
+    # Check if the file was already downloaded
+    if is_downloaded(filename):
+        logging.info(f"{filename} already exists. Skipping download.")
+        result['status'] = 'skipped'
+        return result
+
+    # Resume from the partial file of an earlier attempt or run
+    part_path = filepath + PART_SUFFIX
+    start = time.perf_counter()
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        try:
+            status_code, received, complete = stream_to_part_file(dl_session, url, part_path)
+            result['bytes'] += received
+
+            if complete and status_code in (200, 206):
+                os.replace(part_path, filepath)
+                result['status'] = 'downloaded'
+                result.pop('error', None)
+                if status_code == 206:
+                    logging.info(f"Downloaded {filename} (resumed)")
+                else:
+                    logging.info(f"Downloaded {filename}")
+                break
+
+            if status_code not in (200, 206, 416):
+                logging.error(f"Failed to download {url}: HTTP {status_code}")
+                result['error'] = f"HTTP {status_code}"
+                result['status_code'] = status_code
+                break
+            result['error'] = "incomplete download"
 
         except Exception as e:
-            logging.error(f"Error downloading {url}: {e}")
-
-    print("\nOrganising the file.....")
-
-    # Loop through all files in the source directory
-    for filename in os.listdir(download_dir):
+            logging.error(f"Error downloading {url} (attempt {attempt} of {DOWNLOAD_ATTEMPTS}): {e}")
+            result['error'] = str(e)
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def print_download_summary(results, seconds):
+    downloaded = [result for result in results if result['status'] == 'downloaded']
+    skipped = sum(1 for result in results if result['status'] == 'skipped')
+    failed = [result for result in results if result['status'] == 'failed']
+    total_bytes = sum(result['bytes'] for result in downloaded)
+    throughput = total_bytes / seconds / 1024 / 1024 if seconds > 0 else 0.0
+
+    print(f"\nDownloaded {len(downloaded)} files, skipped {skipped}, failed {len(failed)}")
+    print(f"{total_bytes / 1024 / 1024:.2f} MB in {seconds:.2f}s ({throughput:.2f} MB/s)")
+    for result in failed:
+        print(f"- {result['filename']}: {result.get('error')}")
+
+def organise_downloads(download_dir):
+    """Move the CSV files of the download folder into a folder per lift."""
+    catalog = get_catalog()
+    # Loop through the files the catalog has in the source directory
+    for row in catalog.files(download_dir, statuses=[DOWNLOADED]):
+        filename = row['filename']
         if filename.endswith('.csv'):
             # Split the filename at the hyphens
             parts = filename.split('-')
@@ -249,18 +701,224 @@ def download_csv_files(csv_files, download_dir, token, browser, username, passwo
                 source_file_path = os.path.join(download_dir, filename)
                 destination_file_path = os.path.join(important_dir, filename)
                 shutil.move(source_file_path, destination_file_path)
-
-# Function to compress files into a ZIP archive
-def compress_to_zip(directory, output_path):
-    zip_filename = f"csv_files_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-    zip_filepath = os.path.join(output_path, zip_filename)
+                catalog.record_move(source_file_path, destination_file_path)
+
+def download_csv_files(csv_files, download_dir, token, browser, username, password, session_cookies,
+                       workers=DOWNLOAD_WORKERS, on_finished=None, organise=True):
+    """
+    Download the CSV files and organise them into a folder per lift.
+
+    on_finished(result) is called for each file as soon as it finishes, e.g. to
+    hand it to the next stage of the pipeline, which then organises the files
+    itself (organise=False).
+    """
+    dl_session = DownloadSession(token, browser, username, password, session_cookies, workers)
+
+    # Opening the catalog refreshes it, picking up files added or removed by hand since the last run
+    catalog = get_catalog()
+
+    retry_queue = RetryQueue()
+    retry_queue.forget_unlisted(csv_files)
+
+    new_files = csv_files
+    watermark = None
+    if INCREMENTAL_SYNC:
+        watermark = SyncWatermark(csv_files)
+        print(f"\n{len(watermark.scheduled)} files newer than the sync watermark, "
+              f"{watermark.skipped} already synced")
+        new_files = watermark.scheduled
+
+    csv_files, waiting, permanent = retry_queue.schedule(csv_files, new_files)
+    if waiting or permanent:
+        print(f"{len(waiting)} failed files waiting for their retry backoff, "
+              f"{len(permanent)} permanently broken files skipped")
+    if watermark is not None:
+        # The watermark moves past broken links, but not past files still to be retried
+        for url in permanent:
+            watermark.finish(url, True)
+
+    def finished(result):
+        if result['status'] == 'downloaded':
+            catalog.record(os.path.join(download_dir, result['filename']))
+        retry_queue.finish(result)
+        if watermark is not None:
+            watermark.finish(result['url'], result['status'] in ('downloaded', 'skipped')
+                             or retry_queue.is_permanent(result['url']))
+        if on_finished is not None:
+            on_finished(result)
+        return result
+
+    start = time.perf_counter()
+    if workers <= 1:
+        results = [finished(download_csv_file(dl_session, url, download_dir)) for url in csv_files]
+    else:
+        print(f"\nDownloading {len(csv_files)} files with {workers} workers")
+        results = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(download_csv_file, dl_session, url, download_dir) for url in csv_files]
+            for future in as_completed(futures):
+                results.append(finished(future.result()))
+    dl_session.session.close()
+
+    print_download_summary(results, time.perf_counter() - start)
+
+    if organise:
+        print("\nOrganising the file.....")
+        organise_downloads(download_dir)
+    return results
+
+# "incremental" adds new files to one archive per lift and month, "full" zips every file into a new archive
+ARCHIVE_MODE = load_settings()["archive_mode"]
+# zlib level of the archived files, 0 (stored) to 9 (smallest)
+ARCHIVE_COMPRESSION_LEVEL = int(load_settings()["archive_compression_level"])
+# Number of archives compressed at the same time
+ARCHIVE_WORKERS = max(1, int(load_settings()["archive_workers"]))
+
+def archive_compression():
+    if ARCHIVE_COMPRESSION_LEVEL <= 0:
+        return zipfile.ZIP_STORED, None
+    return zipfile.ZIP_DEFLATED, min(ARCHIVE_COMPRESSION_LEVEL, 9)
+
+def archive_group(file_path):
+    """Archive of a file relative to the ZIP folder: <LIFT>/<LIFT>-<yyyy-mm>.zip."""
+    parsed = parse_csv_filename(os.path.basename(file_path))
+    if parsed is None:
+        # Files outside the naming are grouped by the month they were modified
+        lift, month = 'OTHER', datetime.fromtimestamp(os.path.getmtime(file_path))
+    else:
+        lift, month = parsed
+    return os.path.join(lift, f"{lift}-{month.strftime('%Y-%m')}.zip")
+
+def add_to_archive(zip_filepath, file_paths):
+    """
+    Add the files not yet in a ZIP archive to it, creating the archive when needed.
+
+    Returns:
+    - dict: 'archive', number of files 'added', their 'input_bytes' and compressed 'output_bytes'.
+    """
+    compression, compresslevel = archive_compression()
+    os.makedirs(os.path.dirname(zip_filepath), exist_ok=True)
+    if os.path.exists(zip_filepath) and not zipfile.is_zipfile(zip_filepath):
+        # E.g. left by an interrupted run; its files are archived again into a new archive
+        logging.warning(f"{zip_filepath} is not a valid ZIP archive, moving it to {zip_filepath}.corrupt")
+        os.replace(zip_filepath, zip_filepath + '.corrupt')
+
+    result = {'archive': zip_filepath, 'added': 0, 'input_bytes': 0, 'output_bytes': 0}
+    with zipfile.ZipFile(zip_filepath, 'a', compression=compression, compresslevel=compresslevel) as zipf:
+        archived = set(zipf.namelist())
+        added = set()
+        for file_path in file_paths:
+            arcname = os.path.basename(file_path)
+            if arcname in archived:
+                # Another file of the same name added just now is compared by content
+                difference = archived_difference(zipf.getinfo(arcname), file_path, arcname in added)
+                if difference:
+                    logging.warning(f"{file_path} differs from {arcname} in {zip_filepath} ({difference}), "
+                                    f"keeping the archived copy")
+                continue
+            zipf.write(file_path, arcname)
+            info = zipf.getinfo(arcname)
+            archived.add(arcname)
+            added.add(arcname)
+            result['added'] += 1
+            result['input_bytes'] += info.file_size
+            result['output_bytes'] += info.compress_size
+    return result
+
+def file_crc32(file_path):
+    crc = 0
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+def archived_difference(info, file_path, compare_content=False):
+    """
+    How a file differs from its entry in an archive, None when it matches.
+    Unless compare_content is set, the file is only read when it was modified
+    after the entry was written.
+    """
+    stat = os.stat(file_path)
+    if stat.st_size != info.file_size:
+        return f"{stat.st_size} bytes, {info.file_size} archived"
+    # ZIP times have a resolution of 2 seconds
+    if compare_content or datetime.fromtimestamp(stat.st_mtime) > datetime(*info.date_time) + timedelta(seconds=2):
+        if file_crc32(file_path) != info.CRC:
+            return "same size, different CRC"
+    return None
+
+def write_full_archive(zip_filepath, file_paths):
+    """Store every file uncompressed in a new ZIP archive, files of the same name included."""
+    result = {'archive': zip_filepath, 'added': 0, 'input_bytes': 0, 'output_bytes': 0}
     with zipfile.ZipFile(zip_filepath, 'w') as zipf:
-        for root, dirs, files in os.walk(directory):
-            for file in files:
-                zipf.write(os.path.join(root, file), file)
-    logging.info(f"Files compressed into {zip_filepath}")
-
-def main():
+        for file_path in file_paths:
+            zipf.write(file_path, os.path.basename(file_path))
+            info = zipf.infolist()[-1]
+            result['added'] += 1
+            result['input_bytes'] += info.file_size
+            result['output_bytes'] += info.compress_size
+    return result
+
+def archived_files(directory):
+    """Every downloaded file of a directory, without the partial downloads."""
+    file_paths = []
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if not file.endswith(PART_SUFFIX):
+                file_paths.append(os.path.join(root, file))
+    return file_paths
+
+def log_archive_summary(results, seconds):
+    added = sum(result['added'] for result in results)
+    input_bytes = sum(result['input_bytes'] for result in results)
+    output_bytes = sum(result['output_bytes'] for result in results)
+    ratio = f", {output_bytes / input_bytes:.1%} of the input" if input_bytes else ""
+    logging.info(f"Archived {added} files into {sum(1 for result in results if result['added'])} archives "
+                 f"in {seconds:.2f}s: {input_bytes / 1024 / 1024:.2f} MB in, {output_bytes / 1024 / 1024:.2f} MB out{ratio}")
+
+# Function to compress files into ZIP archives
+def compress_to_zip(directory, output_path):
+    start = time.perf_counter()
+    file_paths = archived_files(directory)
+
+    if ARCHIVE_MODE == 'full':
+        zip_filename = f"csv_files_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        results = [write_full_archive(os.path.join(output_path, zip_filename), file_paths)]
+        logging.info(f"Files compressed into {results[0]['archive']}")
+        log_archive_summary(results, time.perf_counter() - start)
+        return results
+
+    groups = {}
+    for file_path in file_paths:
+        groups.setdefault(archive_group(file_path), []).append(file_path)
+
+    # zlib releases the GIL while compressing, so separate archives compress in parallel threads
+    results = []
+    with ThreadPoolExecutor(max_workers=ARCHIVE_WORKERS) as executor:
+        futures = {executor.submit(add_to_archive, os.path.join(output_path, group), paths): group
+                   for group, paths in sorted(groups.items())}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f"Error archiving {futures[future]}: {e}")
+                continue
+            if result['added']:
+                logging.info(f"{result['archive']}: {result['added']} new files, "
+                             f"{result['input_bytes']} bytes in, {result['output_bytes']} bytes out")
+            results.append(result)
+
+    log_archive_summary(results, time.perf_counter() - start)
+    return results
+
+def log_in():
+    """
+    Log in and list the CSV files on the server.
+
+    Returns:
+    - tuple: (csv_files, token, browser, username, password, session_cookies), or None when the
+      login is not possible. browser is None unless the Selenium fallback was used.
+    """
     credentials = load_credentials()
 
     if not credentials.get('username') or not credentials.get('password'):
@@ -269,34 +927,56 @@ def main():
     else:
         username, password = display_and_amend_credentials(credentials)
 
-    chrome_options = Options()
-    chrome_options.add_argument('--ignore-ssl-errors=yes')
-    chrome_options.add_argument('--ignore-certificate-errors')
-    # chrome_options.add_argument("-incognito")
-    chrome_options.add_experimental_option("excludeSwitches", ['enable-automation'])
+    # Log in without a browser when possible, Selenium is the fallback
+    browser = None
+    http_login = start_http_session(username, password)
+    if http_login:
+        token, session_cookies, csv_files = http_login
+    else:
+        if webdriver is None:
+            print("\nLogin over HTTP failed and Selenium is not installed.")
+            return None
+        logging.info("Logging in with Selenium")
 
-    service = Service(ChromeDriverManager().install())
-    browser = webdriver.Chrome(service=service, options=chrome_options)
+        chrome_options = Options()
+        chrome_options.add_argument('--ignore-ssl-errors=yes')
+        chrome_options.add_argument('--ignore-certificate-errors')
+        # chrome_options.add_argument("-incognito")
+        chrome_options.add_experimental_option("excludeSwitches", ['enable-automation'])
 
-    token = None
-    while not token:
-        token = login_with_selenium(username, password, browser)
-        if not token:
-            username, password = prompt_for_credentials()
+        service = Service(ChromeDriverManager().install())
+        browser = webdriver.Chrome(service=service, options=chrome_options)
+
+        token = None
+        while not token:
+            token = login_with_selenium(username, password, browser)
+            if not token:
+                username, password = prompt_for_credentials()
+
+        csv_files = get_csv_files(browser)
 
-    csv_files = get_csv_files(browser)
-    save_csv_links_to_json(csv_files, token)
-    logging.info(f"CSV file links and token saved to {csv_path_link}")
+        # Get session cookies from the browser
+        session_cookies = get_session_cookies(browser)
+        save_session_cache(token, session_cookies)
 
-    # Get session cookies from the browser
-    session_cookies = get_session_cookies(browser)
+    if save_csv_links_to_json(csv_files, token):
+        logging.info(f"CSV file links and token saved to {csv_path_link}")
+
+    return csv_files, token, browser, username, password, session_cookies
+
+def main():
+    login = log_in()
+    if login is None:
+        return
+    csv_files, token, browser, username, password, session_cookies = login
 
     download_csv_files(csv_files, download_dir, token, browser, username, password, session_cookies)
     
     output_path = get_download_path()
     compress_to_zip(download_dir, output_path)
     
-    browser.quit()
+    if browser is not None:
+        browser.quit()
 
     
 
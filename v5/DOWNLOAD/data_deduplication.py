@@ -1,69 +1,166 @@
+import numpy as np
 import pandas as pd
 import os
 import json
+from download_settings import load_settings
+from file_catalog import get_catalog
+from csv_loader import read_telemetry_csv, iter_telemetry_csv, should_stream
+from timeline_store import sync_store
+
+def same_as_previous(values):
+    """
+    Whether each value of a column equals the value before it, as a boolean
+    array one shorter than the column. Values count as equal when their text
+    in the CSV key would be, so floats are compared by their bits (0.0 and
+    -0.0 differ) and values of different types by their text.
+    """
+    values = values.array if isinstance(values.dtype, pd.api.extensions.ExtensionDtype) else values.to_numpy()
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        bits = values.view(f'u{values.dtype.itemsize}')
+        return bits[1:] == bits[:-1]
+    same = values[1:] == values[:-1]
+    if hasattr(same, 'to_numpy'):
+        same = same.to_numpy(dtype=bool, na_value=False)
+    same = np.asarray(same, dtype=bool)
+    if isinstance(values, np.ndarray) and values.dtype == object:
+        # e.g. the 0 filled into a text column against the text '0'
+        for i in np.flatnonzero(~same):
+            if type(values[i]) is not type(values[i + 1]):
+                same[i] = str(values[i]) == str(values[i + 1])
+    return same
+
+def consecutive_duplicates(df, columns, previous_row=None):
+    """
+    Rows equal to the row before them in every column, as a boolean array.
+
+    Compares each column with itself shifted by one row, without building a
+    text key per row. previous_row is a one-row DataFrame holding the row
+    before the first row of df, e.g. the last row of the previous chunk.
+    """
+    duplicates = np.zeros(len(df), dtype=bool)
+    if len(df) == 0:
+        return duplicates
+
+    same = np.ones(len(df) - 1, dtype=bool)
+    first_same = previous_row is not None
+    for column in columns:
+        same &= same_as_previous(df[column])
+        if first_same:
+            boundary = pd.concat([previous_row[column], df[column].iloc[:1]], ignore_index=True)
+            first_same = bool(same_as_previous(boundary)[0])
+
+    duplicates[0] = first_same
+    duplicates[1:] = same
+    return duplicates
 
 def deduplicate_csv(input_file, output_file, ignore_columns):
-    """Deduplicate rows in a CSV file based on specified columns."""
+    """Deduplicate rows in a CSV file based on specified columns, returning whether the output was saved."""
+    if should_stream(input_file, stream_threshold_mb, chunk_rows):
+        return deduplicate_csv_chunked(input_file, output_file, ignore_columns, chunk_rows)
+
     try:
-        df = pd.read_csv(input_file)
+        # Keep the default dtypes and the C parser so the cleaned CSV is written exactly as before:
+        # pyarrow parses timestamps and rounds some floats before they are written back
+        df = read_telemetry_csv(input_file, compact=False, engine='c')
         df.fillna(0, inplace=True)
 
         # Drop the columns that should be ignored for deduplication
         columns_to_check = df.columns.difference(ignore_columns)
         # print(f"Columns considered for deduplication: {columns_to_check.tolist()}")
 
-        # Create a 'concatenate' column by combining all non-ignored columns
-        df['concatenate'] = df[columns_to_check].astype(str).agg(' '.join, axis=1)
+        # Identify duplicates by comparing each row with the previous row
+        duplicates = consecutive_duplicates(df, columns_to_check)
+
+        # Report number of rows deleted
+        print(f"Total rows to delete: {int(duplicates.sum())}")
 
-        # Check if the 'concatenate' column was created successfully
-        column_name = 'concatenate'
-        if column_name not in df.columns:
-            print(f"Column '{column_name}' not found in the DataFrame.")
-        else:
-            print(f"Using column: {column_name}")
+        # Drop duplicates and save the cleaned DataFrame
+        df_cleaned = df[~duplicates].reset_index(drop=True)
+        df_cleaned.to_csv(output_file, index=False)
+        print(f"Cleaned data saved to {output_file}")
+        return True
 
-            # Identify duplicates by comparing each row with the previous row
-            to_keep = [True] * len(df)
-            deleted_rows = []
+    except Exception as e:
+        print(f"Error processing file {input_file}: {e}")
+        return False
 
-            for i in range(1, len(df)):
-                if df[column_name].iloc[i] == df[column_name].iloc[i - 1]:
-                    to_keep[i] = False
-                    deleted_rows.append(i + 1)  # 1-based index
 
-            # Report number of rows deleted
-            print(f"Total rows to delete: {len(deleted_rows)}")
-            # print(f"Rows deleted: {deleted_rows}")
+def deduplicate_csv_chunked(input_file, output_file, ignore_columns, chunk_rows):
+    """
+    Deduplicate a CSV file chunk by chunk, with the same result as deduplicate_csv.
 
-            # Drop duplicates and save the cleaned DataFrame
-            df_cleaned = df[to_keep].drop(columns=['concatenate']).reset_index(drop=True)
-            df_cleaned.to_csv(output_file, index=False)
-            print(f"Cleaned data saved to {output_file}")
+    The last row of each chunk is carried into the next one, so a duplicate
+    straddling a chunk boundary is dropped too. Peak memory stays bounded by
+    the chunk size.
+    """
+    print(f"Streaming {input_file} in chunks of {chunk_rows} rows")
+    temp_file = output_file + '.tmp'
+    try:
+        previous_row = None
+        deleted_rows = 0
+        header = True
+
+        for chunk in iter_telemetry_csv(input_file, chunk_rows=chunk_rows):
+            if chunk.empty:
+                continue
+            chunk = chunk.fillna(0)
+
+            # Compare each row with the previous row, across the chunk boundary for the first one
+            columns_to_check = chunk.columns.difference(ignore_columns)
+            duplicates = consecutive_duplicates(chunk, columns_to_check, previous_row)
+            deleted_rows += int(duplicates.sum())
+            previous_row = chunk.iloc[[-1]]
+
+            chunk[~duplicates].to_csv(temp_file, mode='w' if header else 'a', header=header, index=False)
+            header = False
+
+        if header:
+            # Header-only file
+            pd.read_csv(input_file, nrows=0).to_csv(temp_file, index=False)
+
+        # Only replace the output once the whole file was deduplicated
+        os.replace(temp_file, output_file)
+        print(f"Total rows to delete: {deleted_rows}")
+        print(f"Cleaned data saved to {output_file}")
+        return True
 
     except Exception as e:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
         print(f"Error processing file {input_file}: {e}")
+        return False
+
 
+def deduplicated_file_path(input_file_path, input_dir, output_dir):
+    """Output path of a CSV file, keeping its folder structure under output_dir."""
+    relative_path = os.path.relpath(os.path.dirname(os.path.abspath(input_file_path)), os.path.abspath(input_dir))
+    return os.path.join(output_dir, relative_path, os.path.basename(input_file_path))
+
+def deduplicate_catalogued_file(input_file_path, input_dir, output_dir, ignore_columns):
+    """Deduplicate one CSV file and record its output in the file catalog, returning the output path."""
+    output_file_path = deduplicated_file_path(input_file_path, input_dir, output_dir)
+    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+
+    # Deduplicate the CSV file
+    print(f"Processing file: {input_file_path}")
+    if deduplicate_csv(input_file_path, output_file_path, ignore_columns):
+        get_catalog().record_deduplicated(input_file_path, output_file_path)
+    return output_file_path
 
 def process_all_csv_files(input_dir, output_dir, ignore_columns):
-    """Process all CSV files in a directory and its subdirectories."""
-    os.makedirs(output_dir, exist_ok=True)
+    """
+    Process the CSV files in a directory and its subdirectories that changed since they were deduplicated.
 
-    # Use os.walk() to find all CSV files recursively
-    for root, _, files in os.walk(input_dir):
-        for file in files:
-            if file.lower().endswith('.csv'):
-                input_file_path = os.path.join(root, file)
-                
-                # Maintain the same folder structure in the output directory
-                relative_path = os.path.relpath(root, input_dir)
-                output_folder = os.path.join(output_dir, relative_path)
-                os.makedirs(output_folder, exist_ok=True)
-                
-                output_file_path = os.path.join(output_folder, file)
+    The file catalog records the files and their outputs, so unchanged files
+    whose output exists are skipped.
+    """
+    os.makedirs(output_dir, exist_ok=True)
 
-                # Deduplicate the CSV file
-                print(f"Processing file: {input_file_path}")
-                deduplicate_csv(input_file_path, output_file_path, ignore_columns)
+    catalog = get_catalog()
+    pending = catalog.pending_deduplications(input_dir)
+    print(f"{len(pending)} files to deduplicate")
+    for row in pending:
+        deduplicate_catalogued_file(catalog.absolute_path(row), input_dir, output_dir, ignore_columns)
 
 
 # Load paths from file_path.json
@@ -76,19 +173,37 @@ if os.path.exists(FILES_PATH):
             file_path_data = json.load(file)
             input_directory = file_path_data["CSV"]["csv_files"]
             output_directory = file_path_data["CSV"]["data_deduplication"]
+            timeline_store_directory = file_path_data["CSV"]["timeline_store"]
         except json.JSONDecodeError:
             print("\nfile_path.json exists but unable to load files.")
 else:
     print("\nfile_path.json does not exist.")
     input_directory = None
     output_directory = None
+    timeline_store_directory = None
+
+# Files larger than stream_threshold_mb are deduplicated in chunks of chunk_rows rows
+settings = load_settings()
+stream_threshold_mb = settings["stream_threshold_mb"]
+chunk_rows = settings["chunk_rows"]
+update_timeline_store = settings["timeline_store"]
 
 # Specify columns to ignore during deduplication
 ignore_columns = ['id', '_gts', 'created_at']
 
-# Process all CSV files if directories are set correctly
-if input_directory and output_directory and os.path.exists(input_directory):
-    print(f"Starting deduplication in: {input_directory}")
-    process_all_csv_files(input_directory, output_directory, ignore_columns)
-else:
-    print("Invalid or missing input/output directory.")
+def update_timeline():
+    if update_timeline_store and timeline_store_directory:
+        print(f"Updating timeline store in: {timeline_store_directory}")
+        sync_store(output_directory, timeline_store_directory)
+
+def main():
+    # Process all CSV files if directories are set correctly
+    if input_directory and output_directory and os.path.exists(input_directory):
+        print(f"Starting deduplication in: {input_directory}")
+        process_all_csv_files(input_directory, output_directory, ignore_columns)
+        update_timeline()
+    else:
+        print("Invalid or missing input/output directory.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+
+# Settings shared by the download tools, read from the "settings" file of file_path.json
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FILES_PATH = os.path.join(BASE_DIR, 'JSON', 'file_path.json')
+
+# The download scripts import the shared modules in the v5 root (csv_loader.py,
+# timeline_store.py) after this module
+V5_ROOT = os.path.dirname(BASE_DIR)
+if V5_ROOT not in sys.path:
+    sys.path.append(V5_ROOT)
+
+DEFAULT_SETTINGS = {
+    # Files larger than this are deduplicated in chunks of chunk_rows rows (0 disables streaming)
+    "stream_threshold_mb": 512,
+    "chunk_rows": 1000000,
+    # Keep the memory-mapped timeline of each lift in step with the deduplicated CSVs
+    "timeline_store": True,
+    # Concurrent downloads sharing one pooled HTTP session; 1 keeps the sequential
+    # download, set e.g. 4 to download several files at a time
+    "download_workers": 1,
+    # Attempts per file, each resuming the partial download of the previous one
+    "download_attempts": 3,
+    # Minutes a cached login is reused before logging in again
+    "session_ttl_minutes": 30,
+    # Only download files newer than the last synced file of each lift
+    "incremental_sync": True,
+    # Downloaded files waiting between two stages of pipeline.py
+    "pipeline_queue_size": 16,
+    # "incremental" adds new files to one ZIP per lift and month, "full" stores every file
+    # uncompressed in one new ZIP on every run, as before
+    "archive_mode": "incremental",
+    # zlib level of the incremental ZIP archives, 0 stores the files uncompressed
+    "archive_compression_level": 6,
+    # Archives compressed at the same time
+    "archive_workers": 4,
+    # Failed downloads are retried after retry_base_minutes, doubling up to retry_max_minutes
+    "retry_base_minutes": 5,
+    "retry_max_minutes": 1440,
+    # Failures in a row after which a file is not requested again
+    "retry_max_attempts": 10,
+    # Files hashed at the same time by duplicate_check.py (1 hashes one file at a time)
+    "hash_workers": 4
+}
+
+def get_settings_path():
+    settings_path = 'JSON/settings.json'
+    if os.path.exists(FILES_PATH):
+        with open(FILES_PATH, 'r') as file:
+            try:
+                settings_path = json.load(file)["JSON"].get("settings", settings_path)
+            except (json.JSONDecodeError, KeyError):
+                print("\nfile_path.json exists but unable to load files.")
+    return os.path.join(BASE_DIR, settings_path)
+
+def load_settings():
+    """Load settings.json, falling back to DEFAULT_SETTINGS for missing keys."""
+    settings = dict(DEFAULT_SETTINGS)
+    settings_path = get_settings_path()
+    if os.path.exists(settings_path):
+        with open(settings_path, 'r') as file:
+            try:
+                settings.update(json.load(file))
+            except json.JSONDecodeError:
+                print("\nsettings.json exists but unable to load files.")
+    return settings
@@ -1,64 +1,418 @@
 import os
+import time
 import hashlib
 import json
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from download_settings import load_settings
+from file_catalog import get_catalog, DUPLICATE
+
+# Bytes read at once when hashing a whole file
+HASH_BUFFER_BYTES = 1024 * 1024
+# Bytes hashed at the start and at the end of a file to tell apart files of the same size
+HEAD_TAIL_BYTES = 64 * 1024
+# Files hashed at the same time; hashlib releases the GIL, so reads and hashing overlap
+HASH_WORKERS = max(1, int(load_settings()["hash_workers"]))
 
 def hash_file(file_path):
-    """Generate a hash for a file."""
-    hasher = hashlib.md5()
+    """Generate a BLAKE2b hash of the whole content of a file."""
+    hasher = hashlib.blake2b()
+    buffer = bytearray(HASH_BUFFER_BYTES)
+    view = memoryview(buffer)
+    with open(file_path, 'rb', buffering=0) as f:
+        # Read in large chunks into one reused buffer
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            hasher.update(view[:size])
+    return hasher.hexdigest()
+
+def hash_head_tail(file_path, size):
+    """BLAKE2b hash of the first and last HEAD_TAIL_BYTES of a file; the whole file when it is smaller."""
+    hasher = hashlib.blake2b()
     with open(file_path, 'rb') as f:
-        buf = f.read()
-        while buf:
-            hasher.update(buf)
-            buf = f.read(4096)  # Read in chunks to handle large files
+        if size <= 2 * HEAD_TAIL_BYTES:
+            hasher.update(f.read())
+        else:
+            hasher.update(f.read(HEAD_TAIL_BYTES))
+            f.seek(-HEAD_TAIL_BYTES, os.SEEK_END)
+            hasher.update(f.read(HEAD_TAIL_BYTES))
     return hasher.hexdigest()
 
-def hash_folder(folder_path):
-    """Generate a combined hash for all files in a folder."""
-    folder_hasher = hashlib.md5()
-    for root, _, files in os.walk(folder_path):
-        for file in sorted(files):  # Sort files to maintain consistent hashing
-            file_path = os.path.join(root, file)
-            if os.path.isfile(file_path):
-                file_hash = hash_file(file_path)
-                folder_hasher.update(file_hash.encode())
-    return folder_hasher.hexdigest()
+def read_hash(file_path, size, tier):
+    """
+    Read a file for its 'head_tail' or 'full' hash.
+
+    Returns:
+    - tuple: The hash and the number of bytes read.
+    """
+    if tier == 'head_tail' or size <= 2 * HEAD_TAIL_BYTES:
+        # The head and tail hash of a small file covers the whole file
+        return hash_head_tail(file_path, size), min(size, 2 * HEAD_TAIL_BYTES)
+    return hash_file(file_path), size
+
+class HashCache:
+    """
+    Hashes kept in the file catalog between runs. A stored hash is reused
+    while the size, mtime and inode of its file are unchanged, so a run over
+    an unchanged archive reads no file, it only stats them.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.entries = catalog.cached_hashes()
+        self.new = {}
+
+    @staticmethod
+    def signature(stat):
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def lookup(self, file_path, tier, stat):
+        entry = self.entries.get((self.catalog.relative_path(file_path), tier))
+        if entry is not None and entry[:3] == self.signature(stat):
+            return entry[3]
+        return None
+
+    def store(self, file_path, tier, stat, file_hash):
+        key = (self.catalog.relative_path(file_path), tier)
+        self.entries[key] = self.new[key] = (*self.signature(stat), file_hash)
+
+    def save(self):
+        """Write the hashes computed since the last save to the catalog."""
+        self.catalog.store_hashes([(*key, *entry) for key, entry in self.new.items()])
+        self.new = {}
+
+    def prune(self):
+        """
+        Delete the stored hashes of files that are gone or changed since.
+
+        Returns:
+        - int: Number of hashes deleted.
+        """
+        stale = []
+        for (path, tier), entry in self.entries.items():
+            try:
+                stat = os.stat(os.path.join(self.catalog.root, path))
+            except OSError:
+                stale.append((path, tier))
+                continue
+            if entry[:3] != self.signature(stat):
+                stale.append((path, tier))
+        self.catalog.delete_hashes(stale)
+        for key in stale:
+            del self.entries[key]
+            self.new.pop(key, None)
+        return len(stale)
+
+class DuplicateIndex:
+    """
+    Files kept so far, grouped by size.
+
+    A file is only read when a kept file has the same size: first its first
+    and last blocks are hashed, and only files that still match are hashed
+    whole. Files of a unique size, most of the archive, are never read.
+    With a HashCache, a hash computed by an earlier run is reused instead.
+    """
+
+    def __init__(self, cache=None):
+        self.by_size = {}
+        # (path, 'head_tail' or 'full') -> hash
+        self.hashes = {}
+        # ('head_tail' or 'full', size, hash) -> files kept, in the order they were kept
+        self.groups = {}
+        # Group -> number of its files already sorted into the groups of the next tier
+        self.grouped = {}
+        self.cache = cache
+        self.stats = {'files': 0, 'head_tail': 0, 'full': 0, 'cached': 0, 'duplicates': 0,
+                      'bytes': 0, 'seconds': 0.0}
+
+    def known_hash(self, file_path, size, tier, read_path=None):
+        """Hash computed before, in this run or by an earlier one, or None."""
+        key = (file_path, tier)
+        read_path = read_path or file_path
+        if key not in self.hashes and (read_path, tier) in self.hashes:
+            self.hashes[key] = self.hashes[(read_path, tier)]
+        if key not in self.hashes and self.cache is not None:
+            # Stored under file_path; a file about to be moved there keeps its stat
+            cached_hash = self.cache.lookup(file_path, tier, os.stat(read_path))
+            if cached_hash is not None:
+                self.hashes[key] = cached_hash
+                self.stats['cached'] += 1
+        if key not in self.hashes and tier == 'full' and size <= 2 * HEAD_TAIL_BYTES:
+            # The head and tail hash already covered the whole file
+            head_tail_hash = self.known_hash(file_path, size, 'head_tail', read_path)
+            if head_tail_hash is not None:
+                self.hashes[key] = head_tail_hash
+        return self.hashes.get(key)
+
+    def store_hash(self, file_path, tier, file_hash, read_path=None):
+        self.hashes[(file_path, tier)] = file_hash
+        self.stats[tier] += 1
+        if self.cache is not None:
+            self.cache.store(file_path, tier, os.stat(read_path or file_path), file_hash)
+
+    def file_hash(self, file_path, size, tier, read_path=None):
+        file_hash = self.known_hash(file_path, size, tier, read_path)
+        if file_hash is None:
+            start = time.perf_counter()
+            file_hash, hashed_bytes = read_hash(read_path or file_path, size, tier)
+            self.stats['seconds'] += time.perf_counter() - start
+            self.stats['bytes'] += hashed_bytes
+            self.store_hash(file_path, tier, file_hash, read_path)
+        return file_hash
+
+    def hash_all(self, files, tier, workers):
+        """Compute the hash of every (path, size) not known yet, reading workers files at a time."""
+        missing = [(file_path, size) for file_path, size in files
+                   if self.known_hash(file_path, size, tier) is None]
+        if not missing:
+            return
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(lambda file: read_hash(file[0], file[1], tier), missing)
+            for (file_path, _), (file_hash, hashed_bytes) in zip(missing, results):
+                self.stats['bytes'] += hashed_bytes
+                self.store_hash(file_path, tier, file_hash)
+        self.stats['seconds'] += time.perf_counter() - start
+
+    def prefetch(self, files, workers):
+        """
+        Hash in parallel every file find will read for files, given as
+        (path, size) in the order they will be checked: the head and tail of
+        files sharing their size with another file, then the whole of those
+        sharing their head and tail hash too. Which files are kept is still
+        decided by find, one file at a time in order.
+        """
+        by_size = {size: list(file_paths) for size, file_paths in self.by_size.items()}
+        for file_path, size in files:
+            by_size.setdefault(size, []).append(file_path)
+        same_size = [(file_path, size) for size, file_paths in by_size.items() if len(file_paths) > 1
+                     for file_path in file_paths]
+        self.hash_all(same_size, 'head_tail', workers)
+
+        by_head_tail = {}
+        for file_path, size in same_size:
+            by_head_tail.setdefault((size, self.hashes[(file_path, 'head_tail')]), []).append(file_path)
+        same_head_tail = [(file_path, size) for (size, _), file_paths in by_head_tail.items() if len(file_paths) > 1
+                          for file_path in file_paths]
+        self.hash_all(same_head_tail, 'full', workers)
+
+    def narrow(self, group, candidates, tier, size, file_hash):
+        """Files of a group with this hash, hashing only the files kept since the group was last narrowed."""
+        for candidate in candidates[self.grouped.get(group, 0):]:
+            self.groups.setdefault((tier, size, self.file_hash(candidate, size, tier)), []).append(candidate)
+        self.grouped[group] = len(candidates)
+        return self.groups.get((tier, size, file_hash), [])
+
+    def find(self, file_path, size):
+        """Path of a kept file with the same content, or None."""
+        self.stats['files'] += 1
+        candidates = self.by_size.get(size, [])
+        group = ('size', size)
+        for tier in ('head_tail', 'full'):
+            if not candidates:
+                return None
+            file_hash = self.file_hash(file_path, size, tier)
+            candidates = self.narrow(group, candidates, tier, size, file_hash)
+            group = (tier, size, file_hash)
+        if candidates:
+            self.stats['duplicates'] += 1
+            return candidates[0]
+        return None
+
+    def add(self, file_path, size, read_path=None):
+        """
+        Keep a file. With read_path, its hashes are taken from there at once,
+        for a file that is about to be moved to file_path.
+        """
+        if read_path is not None:
+            self.file_hash(file_path, size, 'head_tail', read_path)
+            self.file_hash(file_path, size, 'full', read_path)
+        self.by_size.setdefault(size, []).append(file_path)
+
+    def full_hashes(self):
+        """Whole-file hash of every file hashed whole."""
+        return {file_path: file_hash for (file_path, tier), file_hash in self.hashes.items() if tier == 'full'}
+
+    def save(self):
+        """Keep the hashes computed so far for the next run."""
+        if self.cache is not None:
+            self.cache.save()
+
+def remove_duplicate_files(directory, index=None):
+    """
+    Remove duplicate CSV files in a directory and its subdirectories, keeping the first one in path order.
+
+    The files are taken from the file catalog, which records the hash of
+    each file hashed whole and the removal of each duplicate, and keeps the
+    hashes computed for the next run.
+
+    Returns:
+    - DuplicateIndex: The files kept, to check more files against.
+    """
+    catalog = get_catalog()
+    if index is None:
+        index = DuplicateIndex(HashCache(catalog))
+
+    files = []
+    for row in catalog.files_under(directory):
+        file_path = catalog.absolute_path(row)
+
+        # Check if it's a CSV file (optional filtering)
+        if row['filename'].lower().endswith('.csv') and os.path.isfile(file_path):
+            files.append((file_path, os.path.getsize(file_path)))
+
+    if HASH_WORKERS > 1:
+        index.prefetch(files, HASH_WORKERS)
+
+    for file_path, size in files:
+        original = index.find(file_path, size)
+
+        # Check if the same content is already seen
+        if original is not None:
+            print(f"Duplicate file found: {file_path}. Deleting...")
+            print(f"Hash: {index.file_hash(file_path, size, 'full')}")
+            os.remove(file_path)
+            catalog.set_status(file_path, DUPLICATE)
+        else:
+            index.add(file_path, size)
+
+    catalog.set_hashes({file_path: file_hash for file_path, file_hash in index.full_hashes().items()
+                        if os.path.exists(file_path)})
+    index.save()
+    return index
+
+class FolderDigests:
+    """
+    Merkle digest of each folder: a hash of the digests of its files and of
+    its subfolders, in name order. Each digest is built once and reused by
+    the folders above it, so every file is read at most once however deep it
+    lies. File names are not part of the digest, only the contents, and
+    subfolders without any file add nothing, so every folder without files
+    has the digest of an empty folder.
+    """
+
+    EMPTY = hashlib.blake2b().hexdigest()
+
+    def __init__(self, file_digest):
+        self.file_digest = file_digest
+        self.digests = {}
+
+    def combine(self, folder, files, subfolders):
+        hasher = hashlib.blake2b()
+        for file in sorted(files):
+            hasher.update(b'f' + self.file_digest(os.path.join(folder, file)).encode())
+        for subfolder in sorted(subfolders):
+            subfolder_digest = self.digest(os.path.join(folder, subfolder))
+            if subfolder_digest != self.EMPTY:
+                hasher.update(b'd' + subfolder_digest.encode())
+        self.digests[folder] = hasher.hexdigest()
+        return self.digests[folder]
+
+    def digest(self, folder):
+        if folder not in self.digests:
+            with os.scandir(folder) as entries:
+                entries = list(entries)
+            self.combine(folder,
+                         [entry.name for entry in entries if entry.is_file()],
+                         [entry.name for entry in entries if entry.is_dir(follow_symlinks=False)])
+        return self.digests[folder]
+
+    def forget(self, folder):
+        """Drop the digests of a removed folder and everything under it."""
+        prefix = os.path.join(folder, '')
+        for path in [path for path in self.digests if path == folder or path.startswith(prefix)]:
+            del self.digests[path]
+
+def remove_duplicate_folders(directory, index=None):
+    """
+    Remove folders whose files are identical to those of a folder found before.
+
+    A first bottom-up walk builds a digest of each folder from the sizes of
+    its files only. Folders are hashed by content only when another folder
+    has the same sizes, reusing the whole-file hashes in index when given
+    and those stored by earlier runs.
+    """
+    if index is None:
+        index = DuplicateIndex(HashCache(get_catalog()))
+
+    def content_hash(file_path):
+        return index.file_hash(file_path, os.path.getsize(file_path), 'full')
+
+    # Step 1: digests of the file sizes, from one walk and no reads
+    size_digests = FolderDigests(lambda file_path: str(os.path.getsize(file_path)))
+    folders = []
+    for root, dirs, files in os.walk(directory, topdown=False):
+        size_digests.combine(root, files, dirs)
+        if root != directory:
+            folders.append(root)
+
+    counts = {}
+    for folder in folders:
+        counts[size_digests.digests[folder]] = counts.get(size_digests.digests[folder], 0) + 1
+    # Subfolders before their parent, in name order, so the first folder in path order is kept
+    candidates = sorted((folder for folder in folders if counts[size_digests.digests[folder]] > 1),
+                        key=lambda folder: [(0, part) for part in os.path.relpath(folder, directory).split(os.sep)] + [(1,)])
+
+    if HASH_WORKERS > 1:
+        # Every file under a candidate folder is hashed whole, so hash them all in parallel first
+        candidate_set = set(candidates)
+        files = []
+        for folder in candidates:
+            parent = os.path.dirname(folder)
+            while parent != directory and parent not in candidate_set and os.path.dirname(parent) != parent:
+                parent = os.path.dirname(parent)
+            if parent in candidate_set:
+                # Walked with the candidate folder above it
+                continue
+            for root, _, filenames in os.walk(folder):
+                files.extend((os.path.join(root, filename), os.path.getsize(os.path.join(root, filename)))
+                             for filename in filenames)
+        index.hash_all(files, 'full', HASH_WORKERS)
+
+    # Step 2: content digests of the folders that could be duplicates, children first
+    content_digests = FolderDigests(content_hash)
+    folder_hashes = {}
+    removed = 0
+    for folder_path in candidates:
+        if not os.path.isdir(folder_path):
+            continue
+        folder_hash = content_digests.digest(folder_path)
+
+        if folder_hash in folder_hashes:
+            print(f"Duplicate folder found: {folder_path}. Deleting folder...")
+            shutil.rmtree(folder_path)
+            content_digests.forget(folder_path)
+            prefix = os.path.join(folder_path, '')
+            folder_hashes = {digest: path for digest, path in folder_hashes.items() if not path.startswith(prefix)}
+            get_catalog().set_folder_status(folder_path, DUPLICATE)
+            removed += 1
+        else:
+            folder_hashes[folder_hash] = folder_path
+
+    print(f"Checked {len(folders)} folders: {len(candidates)} with matching file sizes, "
+          f"{len(content_digests.digests)} hashed, {removed} duplicates")
+    index.save()
 
 def find_and_remove_duplicates(directory):
     """Find and remove duplicate files and folders in a directory and its subdirectories."""
-    file_hashes = {}     # To store hashes of individual files
-    folder_hashes = {}   # To store hashes of entire folders
-
     # Step 1: Remove duplicate files within all subdirectories
-    for root, _, files in os.walk(directory):
-        for file in files:
-            file_path = os.path.join(root, file)
-            
-            # Check if it's a CSV file (optional filtering)
-            if file.lower().endswith('.csv') and os.path.isfile(file_path):
-                file_hash = hash_file(file_path)
-                
-                # Check if the file is already seen
-                if file_hash in file_hashes:
-                    print(f"Duplicate file found: {file_path}. Deleting...")
-                    print(f"Hash: {file_hash}")
-                    os.remove(file_path)
-                else:
-                    file_hashes[file_hash] = file_path
-
-    # Step 2: Check for duplicate folders
-    for root, dirs, _ in os.walk(directory, topdown=False):
-        for folder in dirs:
-            folder_path = os.path.join(root, folder)
-            
-            if os.path.isdir(folder_path):
-                folder_hash = hash_folder(folder_path)
-                
-                if folder_hash in folder_hashes:
-                    print(f"Duplicate folder found: {folder_path}. Deleting folder...")
-                    shutil.rmtree(folder_path)
-                else:
-                    folder_hashes[folder_hash] = folder_path
+    index = remove_duplicate_files(directory)
+    stats = index.stats
+    print(f"Checked {stats['files']} files: {stats['head_tail']} head and tail hashed, "
+          f"{stats['full']} hashed whole, {stats['cached']} hashes reused, {stats['duplicates']} duplicates")
+
+    # Step 2: Check for duplicate folders, reusing the file hashes of step 1
+    remove_duplicate_folders(directory, index)
+
+    megabytes = stats['bytes'] / 1024 / 1024
+    if stats['seconds'] > 0:
+        print(f"Hashed {megabytes:.1f} MB in {stats['seconds']:.2f}s "
+              f"({megabytes / stats['seconds']:.1f} MB/s, {HASH_WORKERS} workers)")
+
+    # Step 3: Forget the hashes of files removed or changed since they were hashed
+    print(f"Pruned {index.cache.prune()} stored hashes")
 
 # Specify the directory containing the CSV files
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -75,9 +429,13 @@ else:
     print("\nfile_path.json does not exist.")
     csv_directory = None
 
-# Find and remove duplicates
-if csv_directory and os.path.exists(csv_directory):
-    print(f"Searching for duplicates in: {csv_directory}")
-    find_and_remove_duplicates(csv_directory)
-else:
-    print("CSV directory not found or invalid.")
+def main():
+    # Find and remove duplicates
+    if csv_directory and os.path.exists(csv_directory):
+        print(f"Searching for duplicates in: {csv_directory}")
+        find_and_remove_duplicates(csv_directory)
+    else:
+        print("CSV directory not found or invalid.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+# SQLite catalog of the downloaded CSV files, shared by auto_download.py,
+# duplicate_check.py, organise_jobsite.py and data_deduplication.py.
+# One row per file records its lift, FROM/TO range, size, mtime, content
+# hash, status and deduplicated output, so the stages look files up by
+# index instead of listing and re-parsing the CSV folder on every run.
+#
+# The catalog follows changes made outside the scripts by listing the CSV
+# folder and all its subfolders on every run and comparing the size and mtime
+# of each file with its row; only files that changed are recorded again.
+#
+# The hashes table keeps the content hashes duplicate_check.py computed,
+# with the size, mtime and inode of each file when it was hashed, so an
+# unchanged file is never read again.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FILES_PATH = os.path.join(BASE_DIR, 'JSON', 'file_path.json')
+
+catalog_json_path = 'JSON/file_catalog.db'
+csv_directory = 'CSV Files'
+if os.path.exists(FILES_PATH):
+    with open(FILES_PATH, 'r') as file:
+        try:
+            file_path_data = json.load(file)
+            catalog_json_path = file_path_data["JSON"].get("catalog", catalog_json_path)
+            csv_directory = file_path_data["CSV"]["csv_files"]
+        except (json.JSONDecodeError, KeyError):
+            print("\nfile_path.json existed but unable to load files.")
+else:
+    print("\nfile_path.json is not existed.")
+
+# DATA-<LIFT>-FROM_<yyyy-mm-ddHHMMSS>_TO_<yyyy-mm-ddHHMMSS>.csv
+CSV_FILENAME_PATTERN = re.compile(r'DATA-(?P<lift>[^-]+)-FROM_(?P<start>\d{4}-\d{2}-\d{8})_TO_(?P<end>\d{4}-\d{2}-\d{8})\.csv')
+CSV_TIMESTAMP_FORMAT = '%Y-%m-%d%H%M%S'
+
+# Status of a file: in the CSV folder, in its lift folder, deleted as a duplicate, or gone
+DOWNLOADED = 'downloaded'
+ORGANISED = 'organised'
+DUPLICATE = 'duplicate'
+MISSING = 'missing'
+PRESENT = (DOWNLOADED, ORGANISED)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    lift TEXT,
+    from_ts TEXT,
+    to_ts TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    hash TEXT,
+    status TEXT NOT NULL,
+    output_path TEXT,
+    deduplicated_mtime_ns INTEGER,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS files_filename ON files (filename);
+CREATE INDEX IF NOT EXISTS files_status_folder ON files (status, folder);
+CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+CREATE INDEX IF NOT EXISTS files_lift_to ON files (lift, to_ts);
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT NOT NULL,
+    tier TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    inode INTEGER,
+    hash TEXT,
+    PRIMARY KEY (path, tier)
+);
+'''
+
+UPSERT_SQL = '''
+INSERT INTO files (path, filename, folder, lift, from_ts, to_ts, size, mtime_ns, status, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (path) DO UPDATE SET
+    hash = CASE WHEN files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns THEN files.hash END,
+    size = excluded.size,
+    mtime_ns = excluded.mtime_ns,
+    status = excluded.status,
+    updated_at = excluded.updated_at
+'''
+
+def parse_csv_filename(filename):
+    """Lift name and end time of a daily CSV file, or None when the name does not follow the naming."""
+    match = CSV_FILENAME_PATTERN.fullmatch(filename)
+    if not match:
+        return None
+    try:
+        return match.group('lift'), datetime.strptime(match.group('end'), CSV_TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+def parse_csv_range(filename):
+    """FROM and TO times of a daily CSV file as ISO strings, (None, None) when the name does not follow the naming."""
+    match = CSV_FILENAME_PATTERN.fullmatch(filename)
+    if not match:
+        return None, None
+    try:
+        return tuple(datetime.strptime(match.group(part), CSV_TIMESTAMP_FORMAT).isoformat(sep=' ')
+                     for part in ('start', 'end'))
+    except ValueError:
+        return None, None
+
+def lift_of(filename):
+    """Lift folder a CSV file is organised into (the second part of its name), None for other files."""
+    parts = filename.split('-')
+    if filename.endswith('.csv') and len(parts) > 2:
+        return parts[1].strip()
+    return None
+
+class FileCatalog:
+    """
+    Catalog of the CSV files under one CSV folder.
+
+    Paths are stored relative to the CSV folder; the methods accept
+    absolute paths or paths relative to the working directory. A single
+    connection is shared by all threads, one statement at a time.
+    """
+
+    def __init__(self, db_path, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def relative_path(self, path):
+        relative_path = os.path.relpath(os.path.abspath(path), self.root)
+        return '' if relative_path == os.curdir else relative_path
+
+    def absolute_path(self, row):
+        return os.path.join(self.root, row['path'])
+
+    def execute(self, sql, parameters=()):
+        with self.lock, self.connection:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def upsert(self, path, stat, status=None):
+        """Record a file from its stat; its hash is kept only while its size and mtime are unchanged."""
+        self.upsert_many([(path, stat, status)])
+
+    def upsert_many(self, files):
+        """Record (path, stat, status) files in one transaction."""
+        updated_at = datetime.now().isoformat(sep=' ')
+        parameters = []
+        for path, stat, status in files:
+            folder, filename = os.path.split(path)
+            from_ts, to_ts = parse_csv_range(filename)
+            parameters.append((path, filename, folder, lift_of(filename), from_ts, to_ts, stat.st_size,
+                               stat.st_mtime_ns, status or (DOWNLOADED if folder == '' else ORGANISED), updated_at))
+        with self.lock, self.connection:
+            self.connection.executemany(UPSERT_SQL, parameters)
+
+    def list_folder(self, folder):
+        """
+        CSV files and subfolders of one folder.
+
+        Returns:
+        - tuple: {path: stat} of its CSV files and the paths of its subfolders.
+        """
+        directory = os.path.join(self.root, folder)
+        on_disk = {}
+        subfolders = []
+        if os.path.isdir(directory):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subfolders.append(os.path.join(folder, entry.name))
+                    elif entry.name.lower().endswith('.csv') and entry.is_file():
+                        on_disk[os.path.join(folder, entry.name)] = entry.stat()
+        return on_disk, subfolders
+
+    def scan_folder(self, folder, on_disk=None):
+        """List one folder again, recording new and changed files and marking the removed ones missing."""
+        if on_disk is None:
+            on_disk, _ = self.list_folder(folder)
+
+        with self.lock:
+            removed = []
+            for row in self.execute('SELECT path, size, mtime_ns, status FROM files WHERE folder = ?', (folder,)):
+                stat = on_disk.get(row['path'])
+                if stat is None:
+                    if row['status'] in PRESENT:
+                        removed.append((MISSING, row['path']))
+                elif (row['status'] in PRESENT and row['size'] == stat.st_size
+                      and row['mtime_ns'] == stat.st_mtime_ns):
+                    del on_disk[row['path']]
+            with self.connection:
+                self.connection.executemany('UPDATE files SET status = ? WHERE path = ?', removed)
+            self.upsert_many((path, stat, None) for path, stat in on_disk.items())
+
+    def refresh(self):
+        """
+        Bring the catalog up to date with the CSV folder and all its subfolders.
+
+        Every folder is listed and every file stat'ed, so files edited in
+        place are picked up as well as added and removed ones. A folder's
+        mtime does not change when a file in it is edited, so it cannot be
+        used to skip the folder.
+
+        Returns:
+        - int: Number of folders listed.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        listed = {}
+        pending = ['']
+        while pending:
+            folder = pending.pop()
+            listed[folder], subfolders = self.list_folder(folder)
+            pending.extend(subfolders)
+
+        with self.lock:
+            for folder in sorted(listed):
+                self.scan_folder(folder, listed[folder])
+            # Folders removed since the last run, so their files are marked missing
+            catalogued = {row['folder'] for row in
+                          self.execute('SELECT DISTINCT folder FROM files WHERE status IN (?, ?)', PRESENT)}
+            for folder in sorted(catalogued - set(listed)):
+                self.scan_folder(folder, {})
+        return len(listed)
+
+    def record(self, file_path, status=None):
+        """Record a file written by a stage, e.g. a completed download."""
+        self.upsert(self.relative_path(file_path), os.stat(file_path), status)
+
+    def record_move(self, source_path, destination_path):
+        """Record a file moved by a stage, keeping its hash and the record of its deduplication."""
+        source, destination = self.relative_path(source_path), self.relative_path(destination_path)
+        with self.lock:
+            rows = self.execute('SELECT * FROM files WHERE path = ?', (source,))
+            self.execute('DELETE FROM files WHERE path = ?', (source,))
+            self.upsert(destination, os.stat(destination_path))
+            if rows and rows[0]['hash']:
+                self.execute('UPDATE files SET hash = ? WHERE path = ? AND size = ? AND mtime_ns = ?',
+                             (rows[0]['hash'], destination, rows[0]['size'], rows[0]['mtime_ns']))
+
+    def set_status(self, file_path, status):
+        self.execute('UPDATE files SET status = ?, updated_at = ? WHERE path = ?',
+                     (status, datetime.now().isoformat(sep=' '), self.relative_path(file_path)))
+
+    def set_folder_status(self, folder_path, status):
+        """Set the status of every present file of a folder and its subfolders, e.g. one removed as a duplicate."""
+        folder = self.relative_path(folder_path)
+        self.execute('''UPDATE files SET status = ?, updated_at = ? WHERE status IN (?, ?)
+                        AND (folder = ? OR substr(folder, 1, ?) = ?)''',
+                     (status, datetime.now().isoformat(sep=' '), *PRESENT, folder, len(folder) + 1, folder + os.sep))
+
+    def set_hashes(self, file_hashes):
+        """Record the content hash of each {file_path: hash}, in one transaction."""
+        with self.lock, self.connection:
+            self.connection.executemany('UPDATE files SET hash = ? WHERE path = ?',
+                                        [(file_hash, self.relative_path(file_path))
+                                         for file_path, file_hash in file_hashes.items()])
+
+    def cached_hashes(self):
+        """Every stored hash as {(path, tier): (size, mtime_ns, inode, hash)}."""
+        return {(row['path'], row['tier']): (row['size'], row['mtime_ns'], row['inode'], row['hash'])
+                for row in self.execute('SELECT * FROM hashes')}
+
+    def store_hashes(self, entries):
+        """Store (path, tier, size, mtime_ns, inode, hash) entries in one transaction."""
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)', entries)
+
+    def delete_hashes(self, keys):
+        """Delete the stored hashes of (path, tier) keys in one transaction."""
+        with self.lock, self.connection:
+            self.connection.executemany('DELETE FROM hashes WHERE path = ? AND tier = ?', keys)
+
+    def is_known(self, filename):
+        """Whether a file of this name was downloaded, including one removed as a duplicate of another."""
+        return bool(self.execute('SELECT 1 FROM files WHERE filename = ? AND status IN (?, ?, ?) LIMIT 1',
+                                 (filename, DOWNLOADED, ORGANISED, DUPLICATE)))
+
+    def files(self, folder_path=None, statuses=PRESENT):
+        """Rows of the files of a folder (of every folder when None), in path order."""
+        placeholders = ', '.join('?' for _ in statuses)
+        if folder_path is None:
+            return self.execute(f'SELECT * FROM files WHERE status IN ({placeholders}) ORDER BY path',
+                                tuple(statuses))
+        return self.execute(f'SELECT * FROM files WHERE folder = ? AND status IN ({placeholders}) ORDER BY path',
+                            (self.relative_path(folder_path), *statuses))
+
+    def files_under(self, directory, statuses=PRESENT):
+        """Rows of the files of a directory and its subfolders, in path order."""
+        folder = self.relative_path(directory)
+        if folder == '':
+            return self.files(statuses=statuses)
+        placeholders = ', '.join('?' for _ in statuses)
+        return self.execute(f'''SELECT * FROM files WHERE status IN ({placeholders})
+                                AND (folder = ? OR substr(folder, 1, ?) = ?) ORDER BY path''',
+                            (*statuses, folder, len(folder) + 1, folder + os.sep))
+
+    def pending_deduplications(self, directory):
+        """Rows of the files under a directory not deduplicated since they last changed, or whose output is gone."""
+        return [row for row in self.files_under(directory)
+                if row['output_path'] is None
+                or row['deduplicated_mtime_ns'] != row['mtime_ns']
+                or not os.path.exists(row['output_path'])]
+
+    def record_deduplicated(self, file_path, output_path):
+        self.execute('UPDATE files SET output_path = ?, deduplicated_mtime_ns = mtime_ns WHERE path = ?',
+                     (os.path.abspath(output_path), self.relative_path(file_path)))
+
+    def summary(self):
+        """Number of files of each status."""
+        return {row['status']: row['files'] for row in
+                self.execute('SELECT status, COUNT(*) AS files FROM files GROUP BY status ORDER BY status')}
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_catalog():
+    """The catalog of the CSV folder of file_path.json, opened and refreshed once per process."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = FileCatalog(os.path.join(BASE_DIR, catalog_json_path), os.path.join(BASE_DIR, csv_directory))
+            _catalog.refresh()
+        return _catalog
+
+def set_catalog(catalog):
+    """Use another catalog in this process, e.g. a scratch one for a benchmark."""
+    global _catalog
+    with _catalog_lock:
+        _catalog = catalog
+
+if __name__ == "__main__":
+    # Usage: python file_catalog.py
+    catalog = FileCatalog(os.path.join(BASE_DIR, catalog_json_path), os.path.join(BASE_DIR, csv_directory))
+    print(f"Listed {catalog.refresh()} folders")
+    for status, files in catalog.summary().items():
+        print(f"{status}: {files} files")
+    catalog.close()
@@ -0,0 +1,279 @@
+import os
+import re
+import sys
+import time
+import logging
+import tempfile
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+# Read the Tiny File Manager login form and file listing from the page HTML,
+# without a browser. Rows and links are located with the same simple XPaths
+# as x_path.json, e.g. /html/body/div[1]/form/div[1]/div/table/tbody/tr
+# The listing is parsed with lxml when it is installed, else with html.parser.
+try:
+    import lxml.html
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+# Elements without an end tag
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+                 'source', 'track', 'wbr'}
+
+def parse_xpath(xpath):
+    """Split a simple XPath into (tag, position) steps; position is None when not given."""
+    steps = []
+    for step in xpath.strip('/').split('/'):
+        if step == '.':
+            continue
+        match = re.fullmatch(r'([\w-]+)(?:\[(\d+)\])?', step)
+        if not match:
+            raise ValueError(f"Unsupported XPath step {step!r} in {xpath}")
+        steps.append((match.group(1).lower(), int(match.group(2)) if match.group(2) else None))
+    return steps
+
+def matches_steps(path, steps):
+    """Whether a path of (tag, position) elements matches the XPath steps exactly."""
+    if len(path) != len(steps):
+        return False
+    return all(tag == step_tag and (step_position is None or position == step_position)
+               for (tag, position), (step_tag, step_position) in zip(path, steps))
+
+class ElementPathParser(HTMLParser):
+    """
+    HTML parser that tracks the (tag, position) path of the current element,
+    counting positions among siblings of the same tag as XPath does.
+
+    Like a browser, a <tbody> is implied for rows placed directly in a <table>.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.path = []
+        # Count of each child tag seen so far, per open element
+        self.child_counts = [{}]
+
+    def push(self, tag):
+        counts = self.child_counts[-1]
+        counts[tag] = counts.get(tag, 0) + 1
+        self.path.append((tag, counts[tag]))
+        self.child_counts.append({})
+
+    def pop_to(self, tag):
+        for depth in range(len(self.path) - 1, -1, -1):
+            if self.path[depth][0] == tag:
+                del self.path[depth:]
+                del self.child_counts[depth + 1:]
+                return
+
+    def open_in_table(self, tags):
+        """Whether one of tags is open inside the innermost open table."""
+        for open_tag, _ in reversed(self.path):
+            if open_tag == 'table':
+                return False
+            if open_tag in tags:
+                return True
+        return False
+
+    def handle_starttag(self, tag, attrs):
+        # Cells and rows close the previous cell or row when its end tag was left out
+        if tag in ('td', 'th') and self.path and self.path[-1][0] in ('td', 'th'):
+            self.pop_to(self.path[-1][0])
+        if tag == 'tr' and self.open_in_table({'tr'}):
+            self.pop_to('tr')
+        if tag == 'tr' and self.path and self.path[-1][0] == 'table':
+            self.push('tbody')
+        self.push(tag)
+        self.handle_element(tag, dict(attrs))
+        if tag in VOID_ELEMENTS:
+            self.pop_to(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.pop_to(tag)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        self.pop_to(tag)
+
+    def handle_element(self, tag, attrs):
+        """Called for every start tag once the path includes it."""
+
+class LinkParser(ElementPathParser):
+    """Collect the href of the link_xpath element of every row_xpath row."""
+
+    def __init__(self, row_xpath, link_xpath):
+        super().__init__()
+        self.row_steps = parse_xpath(row_xpath)
+        self.link_steps = parse_xpath(link_xpath)
+        self.links = []
+
+    def handle_element(self, tag, attrs):
+        depth = len(self.row_steps)
+        if (len(self.path) == depth + len(self.link_steps)
+                and matches_steps(self.path[depth:], self.link_steps)
+                and matches_steps(self.path[:depth], self.row_steps)):
+            self.links.append(attrs.get('href'))
+
+class InputParser(ElementPathParser):
+    """Collect the name and value of every <input> element."""
+
+    def __init__(self):
+        super().__init__()
+        self.inputs = {}
+
+    def handle_element(self, tag, attrs):
+        if tag == 'input' and attrs.get('name'):
+            self.inputs.setdefault(attrs['name'], attrs.get('value'))
+
+def find_links_lxml(html, row_xpath, link_xpath):
+    """href of every row link with lxml, in a single XPath query over the whole page."""
+    document = lxml.html.fromstring(html)
+    link_path = link_xpath[2:] if link_xpath.startswith('./') else link_xpath
+    hrefs = document.xpath(f'{row_xpath}/{link_path}/@href')
+    if not hrefs and '/tbody/' in row_xpath:
+        # lxml does not imply <tbody> as browsers do
+        hrefs = document.xpath(f"{row_xpath.replace('/tbody/', '/')}/{link_path}/@href")
+    return [str(href) for href in hrefs]
+
+def find_links_html_parser(html, row_xpath, link_xpath):
+    """href of every row link with the standard library html.parser."""
+    parser = LinkParser(row_xpath, link_xpath)
+    parser.feed(html)
+    parser.close()
+    return parser.links
+
+def parse_csv_links(html, page_url, row_xpath, link_xpath='./td[6]/a[2]', use_lxml=None):
+    """
+    Absolute links to the CSV files of a listing page, parsed in one pass.
+
+    Parameters:
+    - html (str): HTML of the file listing.
+    - page_url (str): URL the listing was loaded from, to resolve relative links.
+    - row_xpath (str): XPath of the listing rows (csv_files_xpath).
+    - link_xpath (str): XPath of the download link within a row.
+    - use_lxml (bool): Parse with lxml, by default when it is installed.
+
+    Returns:
+    - list: Links ending with .csv, in listing order.
+    """
+    if use_lxml is None:
+        use_lxml = HAS_LXML
+    if use_lxml:
+        hrefs = find_links_lxml(html, row_xpath, link_xpath)
+    else:
+        hrefs = find_links_html_parser(html, row_xpath, link_xpath)
+
+    # Download links are query-only ("?p=&dl=..."), which keep the page path; urljoin is slow per row
+    page_path = page_url.split('#', 1)[0].split('?', 1)[0]
+
+    csv_files = []
+    for href in hrefs:
+        if href:
+            link = page_path + href if href.startswith('?') else urljoin(page_url, href)
+            if link.endswith('.csv'):
+                csv_files.append(link)
+    return csv_files
+
+def parse_inputs(html):
+    """Name and value of every <input> of a page."""
+    parser = InputParser()
+    parser.feed(html)
+    parser.close()
+    return parser.inputs
+
+def find_csv_links_per_row(browser, row_xpath, link_xpath='./td[6]/a[2]'):
+    """Look up the CSV links with one WebDriver call per row (slow, for pages the parser cannot read)."""
+    from selenium.webdriver.common.by import By
+
+    csv_files = []
+    try:
+        rows = browser.find_elements(By.XPATH, row_xpath)
+        for row in rows:
+            try:
+                # Locate the <i> element and extract the link
+                i_element = row.find_element(By.XPATH, link_xpath)
+                link = i_element.get_attribute('href')
+                if link and link.endswith('.csv'):
+                    csv_files.append(link)
+            except Exception as e:
+                logging.warning(f"Error finding CSV link in row: {e}")
+    except Exception as e:
+        logging.error(f"Error retrieving CSV files: {e}")
+    return csv_files
+
+# Row XPath of the synthetic listing, the same as csv_files_xpath in x_path.json
+SYNTHETIC_ROW_XPATH = '/html/body/div[1]/form/div[1]/div/table/tbody/tr'
+
+def synthetic_listing(rows):
+    """Tiny File Manager style listing with the given number of daily CSV files."""
+    lines = ['<html><head><title>Tiny File Manager</title></head><body>',
+             '<div class="path"><form method="post"><div class="table-responsive"><div>',
+             '<table class="table" id="main-table"><thead><tr><th></th><th>Name</th><th>Size</th>'
+             '<th>Modified</th><th>Perms</th><th>Actions</th></tr></thead><tbody>']
+    for index in range(rows):
+        day = index % 28 + 1
+        filename = f'DATA-LIFT{index // 28:05d}-FROM_2024-10-{day:02d}000000_TO_2024-10-{day:02d}235959.csv'
+        lines.append(
+            f'<tr><td><input type="checkbox" name="file[]" value="{filename}"></td>'
+            f'<td><a href="?p=&amp;view={filename}">{filename}</a></td><td>1.2 MB</td>'
+            f'<td>21.10.24 00:00</td><td>0644</td><td class="inline-actions">'
+            f'<a title="Delete" href="?p=&amp;del={filename}">x</a>'
+            f'<a title="Download" href="?p=&amp;dl={filename}">dl</a></td></tr>')
+    lines.append('</tbody></table></div></div></form></div><div class="footer"></div></body></html>')
+    return '\n'.join(lines)
+
+def benchmark(row_counts, browser=None):
+    """Time parse_csv_links, and the per-row WebDriver lookups when a browser is given, on synthetic listings."""
+    for rows in row_counts:
+        html = synthetic_listing(rows)
+
+        parsers = [('html.parser', False)] + ([('lxml', True)] if HAS_LXML else [])
+        for name, use_lxml in parsers:
+            start = time.perf_counter()
+            parsed = parse_csv_links(html, 'https://example.com/files.php', SYNTHETIC_ROW_XPATH, use_lxml=use_lxml)
+            parse_seconds = time.perf_counter() - start
+            print(f"{rows:>7} rows  {name + ' parse:':<20}{parse_seconds:8.3f}s ({len(parsed)} links)")
+
+        if browser is None:
+            continue
+
+        with tempfile.NamedTemporaryFile('w', suffix='.html', delete=False) as file:
+            file.write(html)
+        try:
+            browser.get('file://' + os.path.abspath(file.name))
+
+            start = time.perf_counter()
+            per_row = find_csv_links_per_row(browser, SYNTHETIC_ROW_XPATH)
+            per_row_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            single_pass = parse_csv_links(browser.page_source, browser.current_url, SYNTHETIC_ROW_XPATH)
+            single_pass_seconds = time.perf_counter() - start
+        finally:
+            os.remove(file.name)
+
+        print(f"{rows:>7} rows  WebDriver per row: {per_row_seconds:8.3f}s ({len(per_row)} links), "
+              f"page_source + parse: {single_pass_seconds:8.3f}s, same links: {per_row == single_pass}")
+
+if __name__ == "__main__":
+    # Usage: python listing_parser.py [rows,rows,...] [--browser]
+    arguments = [argument for argument in sys.argv[1:] if argument != '--browser']
+    row_counts = [int(rows) for rows in arguments[0].split(',')] if arguments else [100, 1000, 10000]
+
+    browser = None
+    if '--browser' in sys.argv:
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
+        chrome_options = Options()
+        chrome_options.add_argument('--headless=new')
+        browser = webdriver.Chrome(options=chrome_options)
+    try:
+        benchmark(row_counts, browser)
+    finally:
+        if browser is not None:
+            browser.quit()
@@ -1,8 +1,7 @@
 import os
 import shutil
 import json
-
-jobsite = []
+from file_catalog import get_catalog, DOWNLOADED
 
 # Define the directory containing your files
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -22,34 +21,44 @@ else:
 # source_dir = 'C:\Data\Documents\Arduino\Eita Stock Inventory\Excel\Auto Download\\auto_download8\output_csv_files1'  # Change this to your source directory
 # destination_dir = 'C:\Data\Documents\Arduino\Eita Stock Inventory\Excel\Auto Download\\auto_download8\output_csv_files1\Jobsite'  # Change this to your destination directory
 
-# Create the destination directory if it doesn't exist
-os.makedirs(destination_dir, exist_ok=True)
-
-# Loop through all files in the source directory
-for filename in os.listdir(source_dir):
-    if filename.endswith('.csv'):
-        # Split the filename at the hyphens
-        parts = filename.split('-')
-        
-        # Ensure there are enough parts to process
-        if len(parts) > 2:
-            # Extract the important part (the second part)
-            important_part = parts[1].strip()
-
-            # Format the jobsite name as a dictionary object and append to the list
-            jobsite_name = {"jobsite": important_part}
-            jobsite.append(jobsite_name)            
-            
-            # Create a new directory for this important part in the destination directory
-            important_dir = os.path.join(destination_dir, important_part)
-            os.makedirs(important_dir, exist_ok=True)
+def organise_files(source_dir, destination_dir, jobsite_json_path):
+    """Move the CSV files of source_dir into a folder per jobsite and list the jobsites moved."""
+    jobsite = []
+
+    # Create the destination directory if it doesn't exist
+    os.makedirs(destination_dir, exist_ok=True)
+
+    # Loop through the files the catalog has in the source directory
+    catalog = get_catalog()
+    for row in catalog.files(source_dir, statuses=[DOWNLOADED]):
+        filename = row['filename']
+        if filename.endswith('.csv'):
+            # Split the filename at the hyphens
+            parts = filename.split('-')
             
-            # Move the file to the corresponding directory
-            source_file_path = os.path.join(source_dir, filename)
-            destination_file_path = os.path.join(important_dir, filename)
-            shutil.move(source_file_path, destination_file_path)
+            # Ensure there are enough parts to process
+            if len(parts) > 2:
+                # Extract the important part (the second part)
+                important_part = parts[1].strip()
+
+                # Format the jobsite name as a dictionary object and append to the list
+                jobsite_name = {"jobsite": important_part}
+                jobsite.append(jobsite_name)            
+                
+                # Create a new directory for this important part in the destination directory
+                important_dir = os.path.join(destination_dir, important_part)
+                os.makedirs(important_dir, exist_ok=True)
+                
+                # Move the file to the corresponding directory
+                source_file_path = os.path.join(source_dir, filename)
+                destination_file_path = os.path.join(important_dir, filename)
+                shutil.move(source_file_path, destination_file_path)
+                catalog.record_move(source_file_path, destination_file_path)
+
+    with open(jobsite_json_path, 'w') as file:
+        json.dump(jobsite, file, indent=4)
 
-with open(jobsite_json_path, 'w') as file:
-    json.dump(jobsite, file, indent=4)
+    print("Files organized successfully.")
 
-print("Files organized successfully.")
+if __name__ == "__main__":
+    organise_files(source_dir, destination_dir, jobsite_json_path)
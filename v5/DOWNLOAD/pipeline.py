@@ -0,0 +1,172 @@
+import os
+import time
+import queue
+import shutil
+import logging
+import threading
+
+import auto_download
+import duplicate_check
+import organise_jobsite
+import data_deduplication
+from download_settings import load_settings
+from file_catalog import get_catalog, DUPLICATE
+
+# Run auto_download.py, duplicate_check.py, organise_jobsite.py and
+# data_deduplication.py as one pipeline. Each file is checked for duplicates,
+# filed into its lift folder and deduplicated as soon as its download
+# completes, so network and CPU work overlap. The files left in the end are
+# the same as running the scripts one after another.
+
+# Files waiting between two stages; a full queue holds the previous stage back
+QUEUE_SIZE = max(1, int(load_settings()["pipeline_queue_size"]))
+
+# Put after the last file to stop a stage
+STOP = None
+
+def new_stage_stats():
+    return {'files': 0, 'seconds': 0.0}
+
+def run_stage(name, inbox, handle, outbox, stats):
+    """Pass each file of inbox through handle, forwarding its result (unless None) to outbox."""
+    while True:
+        file_path = inbox.get()
+        if file_path is STOP:
+            if outbox is not None:
+                outbox.put(STOP)
+            return
+
+        start = time.perf_counter()
+        try:
+            result = handle(file_path)
+        except Exception as e:
+            print(f"{name} failed for {file_path}: {e}")
+            result = None
+        stats['seconds'] += time.perf_counter() - start
+        stats['files'] += 1
+
+        if result is not None and outbox is not None:
+            outbox.put(result)
+
+def lift_folder_path(download_dir, filename):
+    """Folder a downloaded file is organised into, the download folder itself for other names."""
+    parts = filename.split('-')
+    if filename.endswith('.csv') and len(parts) > 2:
+        return os.path.join(download_dir, parts[1].strip())
+    return download_dir
+
+class DuplicateStage:
+    """Remove downloaded files identical to a file already in the archive, as duplicate_check.py does."""
+
+    def __init__(self, download_dir):
+        self.download_dir = download_dir
+        self.index = None
+
+    def load_archive(self):
+        # Files already organised into lift folders, with their own duplicates removed first.
+        # New downloads wait in the download folder itself, so they are left out here.
+        self.index = duplicate_check.DuplicateIndex(duplicate_check.HashCache(get_catalog()))
+        for entry in os.listdir(self.download_dir):
+            folder = os.path.join(self.download_dir, entry)
+            if os.path.isdir(folder):
+                duplicate_check.remove_duplicate_files(folder, self.index)
+
+    def __call__(self, file_path):
+        if self.index is None:
+            self.load_archive()
+
+        size = os.path.getsize(file_path)
+        if self.index.find(file_path, size) is not None:
+            print(f"Duplicate file found: {file_path}. Deleting...")
+            print(f"Hash: {self.index.file_hash(file_path, size, 'full')}")
+            os.remove(file_path)
+            get_catalog().set_status(file_path, DUPLICATE)
+            return None
+
+        # Kept under the path the organise stage moves it to, hashed now while it is still here
+        filename = os.path.basename(file_path)
+        self.index.add(os.path.join(lift_folder_path(self.download_dir, filename), filename), size, file_path)
+        return file_path
+
+def organise_file(file_path):
+    """Move a downloaded file into its lift folder, as organise_jobsite.py does."""
+    download_dir = os.path.dirname(file_path)
+    filename = os.path.basename(file_path)
+    lift_folder = lift_folder_path(download_dir, filename)
+    if lift_folder == download_dir:
+        return file_path
+
+    os.makedirs(lift_folder, exist_ok=True)
+    destination_file_path = os.path.join(lift_folder, filename)
+    shutil.move(file_path, destination_file_path)
+    get_catalog().record_move(file_path, destination_file_path)
+    return destination_file_path
+
+def deduplicate_file(file_path):
+    """Deduplicate the rows of one organised file, as data_deduplication.py does."""
+    return data_deduplication.deduplicate_catalogued_file(file_path, auto_download.download_dir,
+                                                          data_deduplication.output_directory,
+                                                          data_deduplication.ignore_columns)
+
+def run_pipeline():
+    login = auto_download.log_in()
+    if login is None:
+        return
+    csv_files, token, browser, username, password, session_cookies = login
+
+    download_dir = auto_download.download_dir
+
+    # Files left in the download folder by an earlier run are filed away first
+    auto_download.organise_downloads(download_dir)
+
+    duplicate_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    organise_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    deduplicate_queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+    duplicate_stage = DuplicateStage(download_dir)
+    stages = [
+        ('Duplicate check', duplicate_queue, duplicate_stage, organise_queue),
+        ('Organise', organise_queue, organise_file, deduplicate_queue),
+        ('Deduplication', deduplicate_queue, deduplicate_file, None),
+    ]
+    stats = {name: new_stage_stats() for name, _, _, _ in stages}
+    threads = [threading.Thread(target=run_stage, args=(name, inbox, handle, outbox, stats[name]), daemon=True)
+               for name, inbox, handle, outbox in stages]
+    for thread in threads:
+        thread.start()
+
+    def downloaded(result):
+        if result['status'] == 'downloaded':
+            duplicate_queue.put(os.path.join(download_dir, result['filename']))
+
+    start = time.perf_counter()
+    try:
+        auto_download.download_csv_files(csv_files, download_dir, token, browser, username, password,
+                                         session_cookies, on_finished=downloaded, organise=False)
+    finally:
+        duplicate_queue.put(STOP)
+        for thread in threads:
+            thread.join()
+
+    # Steps that need the whole archive, as in the sequential run
+    duplicate_check.remove_duplicate_folders(download_dir, duplicate_stage.index)
+    if duplicate_stage.index is not None:
+        duplicate_stage.index.cache.prune()
+    organise_jobsite.organise_files(organise_jobsite.source_dir, organise_jobsite.destination_dir,
+                                    organise_jobsite.jobsite_json_path)
+    # Files not deduplicated yet, e.g. by an interrupted run
+    data_deduplication.process_all_csv_files(download_dir, data_deduplication.output_directory,
+                                             data_deduplication.ignore_columns)
+    data_deduplication.update_timeline()
+    auto_download.compress_to_zip(download_dir, auto_download.get_download_path())
+
+    if browser is not None:
+        browser.quit()
+
+    print(f"\nPipeline finished in {time.perf_counter() - start:.2f}s")
+    for name, stage_stats in stats.items():
+        print(f"- {name}: {stage_stats['files']} files, {stage_stats['seconds']:.2f}s busy")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_pipeline()
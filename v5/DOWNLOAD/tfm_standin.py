@@ -0,0 +1,357 @@
+import os
+import sys
+import time
+import shutil
+import logging
+import secrets
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, quote
+
+# Local stand-in for the Tiny File Manager server, to measure the downloader
+# without touching the production file server. It serves the pieces
+# auto_download.py uses:
+# - the login form (fm_usr, fm_pwd and the hidden token), laid out for the
+#   XPaths of x_path.json
+# - the file listing, laid out for csv_files_xpath
+# - "?p=&dl=<file>" POST downloads, which need the token and the session cookie
+#
+# Latency, bandwidth, login expiry and file sizes are configurable.
+
+SESSION_COOKIE = 'filemanager'
+
+LOGIN_PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Tiny File Manager</title></head>
+<body><div class="container"><section class="h-100"><div class="container h-100"><div class="row">
+<div class="card-wrapper"><div class="card"><div class="card-body">
+<form class="form-signin" action="" method="post" autocomplete="off">
+<div class="mb-3"><h1 class="card-title">Tiny File Manager</h1></div>
+<div class="mb-3"><label for="fm_usr">Username</label><input type="text" class="form-control" id="fm_usr" name="fm_usr" required></div>
+<div class="mb-3"><label for="fm_pwd">Password</label><input type="password" class="form-control" id="fm_pwd" name="fm_pwd" required></div>
+<div class="mb-3">{message}</div>
+<div class="mb-3"><button type="submit" class="btn btn-success">Login</button></div>
+<input type="hidden" name="token" value="{token}">
+</form></div></div></div></div></div></section></div></body></html>'''
+
+LISTING_HEADER = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Tiny File Manager</title></head>
+<body><div class="container-fluid"><form action="" method="post" class="pt-3">
+<div class="table-responsive"><div>
+<table class="table" id="main-table"><thead><tr><th></th><th>Name</th><th>Size</th><th>Modified</th><th>Perms</th><th>Actions</th></tr></thead><tbody>'''
+
+LISTING_ROW = ('<tr><td><input type="checkbox" name="file[]" value="{name}"></td>'
+               '<td><a href="?p=&amp;view={link}">{name}</a></td><td>{size}</td>'
+               '<td>21.10.24 00:00</td><td>0644</td><td class="inline-actions">'
+               '<a title="Delete" href="?p=&amp;del={link}">x</a>'
+               '<a title="Download" href="?p=&amp;dl={link}">dl</a></td></tr>')
+
+LISTING_FOOTER = '</tbody></table></div></div></form></div><div class="footer"></div></body></html>'
+
+# Bytes written between two bandwidth checks
+SEND_CHUNK_BYTES = 64 * 1024
+
+def synthetic_filenames(count, lifts=3):
+    """Daily CSV file names of a few lifts, in the naming of the production server."""
+    names = []
+    for index in range(count):
+        day = index // lifts
+        date = time.strftime('%Y-%m-%d', time.gmtime(1704067200 + day * 86400))
+        names.append(f'DATA-LIFT{index % lifts}-FROM_{date}000000_TO_{date}235959.csv')
+    return names
+
+def synthetic_csv(filename, size):
+    """Telemetry-like CSV content of about size bytes, different for every file name."""
+    header = '_gts,_mb1s,_mb2s,_lfls,_lds,created_at\n'
+    rows = [header]
+    length = len(header)
+    second = 0
+    seed = sum(filename.encode())
+    while length < size:
+        row = (f'2024-01-01 {second // 3600 % 24:02d}:{second // 60 % 60:02d}:{second % 60:02d},'
+               f'{(second + seed) // 7 % 2},{(second + seed) // 9 % 2},{(second + seed) // 20 % 12 + 1},'
+               f'{(second + seed) // 11 % 2},{filename[:24]}\n')
+        rows.append(row)
+        length += len(row)
+        second += 1
+    return ''.join(rows).encode()[:max(size, len(header))]
+
+class TinyFileManagerStandIn:
+    """
+    Threaded HTTP server emulating Tiny File Manager.
+
+    Parameters:
+    - files (dict): Size in bytes of each file of the listing.
+    - username, password (str): Credentials the login form accepts.
+    - latency (float): Seconds added before every response.
+    - bandwidth (float): Bytes per second sent per download, 0 for no limit.
+    - session_ttl (float): Seconds a login stays valid; downloads then answer 401. 0 never expires.
+    - supports_range (bool): Answer Range requests with 206, as the real server does.
+    """
+
+    def __init__(self, files, username='admin', password='admin', latency=0.0, bandwidth=0.0,
+                 session_ttl=0.0, supports_range=True, host='127.0.0.1', port=0):
+        self.files = dict(files)
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.session_ttl = session_ttl
+        self.supports_range = supports_range
+
+        # Session id -> {'token', 'logged_in_at'}
+        self.sessions = {}
+        self.contents = {}
+        self.lock = threading.Lock()
+        self.stats = {'logins': 0, 'listings': 0, 'downloads': 0, 'unauthorized': 0, 'bytes': 0}
+
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/index.php'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, stat, amount=1):
+        with self.lock:
+            self.stats[stat] += amount
+
+    def content(self, filename):
+        with self.lock:
+            if filename not in self.contents:
+                self.contents[filename] = synthetic_csv(filename, self.files[filename])
+            return self.contents[filename]
+
+    def session(self, session_id):
+        """The session of a cookie, creating a new one with a fresh token when unknown."""
+        with self.lock:
+            if session_id not in self.sessions:
+                session_id = secrets.token_hex(16)
+                self.sessions[session_id] = {'token': secrets.token_hex(32), 'logged_in_at': None}
+            return session_id, self.sessions[session_id]
+
+    def is_logged_in(self, session):
+        if session['logged_in_at'] is None:
+            return False
+        return not self.session_ttl or time.monotonic() - session['logged_in_at'] < self.session_ttl
+
+    def listing(self):
+        rows = [LISTING_ROW.format(name=name, link=quote(name), size=f'{size / 1024:.1f} KB')
+                for name, size in self.files.items()]
+        return LISTING_HEADER + ''.join(rows) + LISTING_FOOTER
+
+    def handler_class(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                logging.debug(format % args)
+
+            def session_id(self):
+                for cookie in self.headers.get('Cookie', '').split(';'):
+                    name, _, value = cookie.strip().partition('=')
+                    if name == SESSION_COOKIE:
+                        return value
+                return None
+
+            def send_page(self, status, body, session_id=None):
+                data = body.encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                if session_id is not None and session_id != self.session_id():
+                    self.send_header('Set-Cookie', f'{SESSION_COOKIE}={session_id}; path=/; HttpOnly')
+                self.end_headers()
+                self.wfile.write(data)
+
+            def read_form(self):
+                length = int(self.headers.get('Content-Length', 0))
+                return {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+
+            def do_GET(self):
+                time.sleep(standin.latency)
+                session_id, session = standin.session(self.session_id())
+                if standin.is_logged_in(session):
+                    standin.count('listings')
+                    self.send_page(200, standin.listing(), session_id)
+                else:
+                    self.send_page(200, LOGIN_PAGE.format(token=session['token'], message=''), session_id)
+
+            def do_POST(self):
+                time.sleep(standin.latency)
+                form = self.read_form()
+                session_id, session = standin.session(self.session_id())
+                query = parse_qs(urlparse(self.path).query)
+
+                if 'dl' in query:
+                    if not standin.is_logged_in(session) or form.get('token') != session['token']:
+                        standin.count('unauthorized')
+                        self.send_page(401, 'Unauthorized', session_id)
+                        return
+                    self.send_file(query['dl'][0])
+                    return
+
+                if (form.get('fm_usr') == standin.username and form.get('fm_pwd') == standin.password
+                        and form.get('token') == session['token']):
+                    session['logged_in_at'] = time.monotonic()
+                    standin.count('logins')
+                    standin.count('listings')
+                    self.send_page(200, standin.listing(), session_id)
+                else:
+                    self.send_page(200, LOGIN_PAGE.format(token=session['token'], message='Login failed'), session_id)
+
+            def send_file(self, filename):
+                if filename not in standin.files:
+                    self.send_page(404, 'File not found')
+                    return
+                data = standin.content(filename)
+
+                start = range_start(self.headers.get('Range', '')) if standin.supports_range else None
+                if start is not None:
+                    if start >= len(data):
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{len(data)}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+                else:
+                    start = 0
+                    self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+                self.send_header('Content-Length', str(len(data) - start))
+                self.end_headers()
+
+                sent_start = time.monotonic()
+                sent = 0
+                for offset in range(start, len(data), SEND_CHUNK_BYTES):
+                    chunk = data[offset:offset + SEND_CHUNK_BYTES]
+                    self.wfile.write(chunk)
+                    sent += len(chunk)
+                    if standin.bandwidth:
+                        # Sleep until the bytes sent so far fit the bandwidth
+                        delay = sent / standin.bandwidth - (time.monotonic() - sent_start)
+                        if delay > 0:
+                            time.sleep(delay)
+                standin.count('downloads')
+                standin.count('bytes', sent)
+
+        return Handler
+
+def range_start(header):
+    """Start offset of a "bytes=<start>-" Range header, None for anything else."""
+    if not header.startswith('bytes='):
+        return None
+    start, _, end = header[len('bytes='):].partition('-')
+    if not start.isdigit() or end:
+        return None
+    return int(start)
+
+def point_downloader_at(auto_download, url, work_dir):
+    """
+    Make auto_download.py use the stand-in and a scratch folder, so a
+    benchmark leaves the real session cache, sync state, retry queue and catalog alone.
+    """
+    import file_catalog
+
+    auto_download.TINY_FILE_MANAGER = url
+    auto_download.session_cache_file = os.path.join(work_dir, 'session.json')
+    auto_download.retry_queue_file = os.path.join(work_dir, 'retry_queue.json')
+    auto_download.INCREMENTAL_SYNC = False
+    download_dir = os.path.join(work_dir, 'CSV Files')
+    os.makedirs(download_dir, exist_ok=True)
+    file_catalog.set_catalog(file_catalog.FileCatalog(os.path.join(work_dir, 'file_catalog.db'), download_dir))
+    return download_dir
+
+def benchmark(worker_counts, file_count, file_size, latency, bandwidth, session_ttl):
+    """Download every file of a stand-in with each number of workers, reporting files/s and MB/s."""
+    import auto_download
+
+    files = {name: file_size for name in synthetic_filenames(file_count)}
+    print(f"\n{file_count} files of {file_size / 1024:.0f} KB, latency {latency * 1000:.0f} ms, "
+          f"bandwidth {'unlimited' if not bandwidth else f'{bandwidth / 1024 / 1024:.1f} MB/s per download'}, "
+          f"login expiry {'never' if not session_ttl else f'{session_ttl:g}s'}")
+
+    for workers in worker_counts:
+        with TinyFileManagerStandIn(files, latency=latency, bandwidth=bandwidth, session_ttl=session_ttl) as standin:
+            work_dir = tempfile.mkdtemp(prefix='tfm_benchmark_')
+            try:
+                download_dir = point_downloader_at(auto_download, standin.url, work_dir)
+                login = auto_download.start_http_session(standin.username, standin.password)
+                if login is None:
+                    print("Login to the stand-in failed")
+                    return
+                token, cookies, csv_files = login
+
+                start = time.perf_counter()
+                results = auto_download.download_csv_files(csv_files, download_dir, token, None, standin.username,
+                                                           standin.password, cookies, workers=workers, organise=False)
+                seconds = time.perf_counter() - start
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+            downloaded = [result for result in results if result['status'] == 'downloaded']
+            total_bytes = sum(result['bytes'] for result in downloaded)
+            print(f"{workers:>3} workers: {len(downloaded)}/{file_count} files in {seconds:7.2f}s, "
+                  f"{len(downloaded) / seconds:8.2f} files/s, {total_bytes / seconds / 1024 / 1024:8.2f} MB/s, "
+                  f"{standin.stats['logins']} logins, {standin.stats['unauthorized']} x 401")
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Tiny File Manager stand-in and download benchmark")
+    parser.add_argument('command', choices=['serve', 'benchmark'])
+    parser.add_argument('--files', type=int, default=100, help="number of CSV files listed")
+    parser.add_argument('--size-kb', type=float, default=1024, help="size of every file in KB")
+    parser.add_argument('--latency-ms', type=float, default=20, help="delay before every response")
+    parser.add_argument('--bandwidth-mbps', type=float, default=0, help="MB/s per download, 0 for no limit")
+    parser.add_argument('--session-ttl', type=float, default=0, help="seconds until a login expires, 0 never")
+    parser.add_argument('--workers', default=None, help="comma separated worker counts to benchmark")
+    parser.add_argument('--port', type=int, default=8080, help="port of the serve command")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    # Usage: python tfm_standin.py serve [--port 8080] [options]
+    #        python tfm_standin.py benchmark [--workers 1,4,8] [options]
+    arguments = parse_arguments(sys.argv[1:])
+    latency = arguments.latency_ms / 1000
+    bandwidth = arguments.bandwidth_mbps * 1024 * 1024
+    file_size = int(arguments.size_kb * 1024)
+
+    if arguments.command == 'serve':
+        logging.basicConfig(level=logging.DEBUG)
+        standin = TinyFileManagerStandIn({name: file_size for name in synthetic_filenames(arguments.files)},
+                                         latency=latency, bandwidth=bandwidth, session_ttl=arguments.session_ttl,
+                                         port=arguments.port)
+        print(f"Serving {arguments.files} files on {standin.url} (username admin, password admin)")
+        print("Put this URL in JSON/url.json to run auto_download.py against it. Ctrl+C to stop.")
+        try:
+            standin.server.serve_forever()
+        except KeyboardInterrupt:
+            standin.server.server_close()
+    else:
+        logging.basicConfig(level=logging.WARNING)
+        from download_settings import load_settings
+        worker_counts = ([int(workers) for workers in arguments.workers.split(',')] if arguments.workers
+                         else sorted({1, 4, max(1, int(load_settings()["download_workers"]))}))
+        benchmark(worker_counts, arguments.files, file_size, latency, bandwidth, arguments.session_ttl)
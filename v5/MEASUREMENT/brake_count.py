@@ -1,6 +1,10 @@
-import pandas as pd
+import numpy as np
 import os
 import json
+from lift_pool import list_lift_folders, run_lifts
+from manifest import measure_files
+from measurement_settings import load_settings
+from csv_loader import read_telemetry_csv, iter_telemetry_csv, should_stream
 
 # Define base directories
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -20,73 +24,140 @@ else:
 csv_base_folder = os.path.join(root, csv_dir)
 output_directory = os.path.join(root, out_json_dir)
 
-def analyze_lift(lift_folder, lift_name):
-    """Analyze all CSV files in a given lift folder."""
+# Engine used to count brake states: 'vector' (default), 'loop' (original
+# row-by-row implementation) or 'both' (run both and report mismatches)
+settings = load_settings()
+BRAKE_ENGINE = settings["brake_engine"]
+
+# Files larger than STREAM_THRESHOLD_MB are read in chunks of CHUNK_ROWS rows
+STREAM_THRESHOLD_MB = settings["stream_threshold_mb"]
+CHUNK_ROWS = settings["chunk_rows"]
+
+# Columns read from each CSV file
+BRAKE_COLUMNS = ['_mb1s', '_mb2s']
+
+def count_brake_states_loop(df):
+    """Count brake states and cycles by walking every row (original engine)."""
+    # Initialize a boolean mask for rows to keep
+    to_keep = [True] * len(df)
+
+    # Track deletions and cycles
+    deleted_rows = []
+    cycles = 0
+    prev_state = None
+
+    # Compare each row with the previous row to mark continuous duplicates and count cycles
+    for i in range(len(df)):
+        current_state = (df['_mb1s'].iloc[i], df['_mb2s'].iloc[i])
+
+        if i > 0:
+            if current_state == prev_state:
+                to_keep[i] = False
+                deleted_rows.append(i + 1)  # 1-based index for progress display
+            elif prev_state == (1, 1) and current_state == (0, 0):
+                cycles += 1
+
+        prev_state = current_state
+
+    # Drop the marked rows
+    df_cleaned = df[to_keep].reset_index(drop=True)
+
+    # Count occurrences of 0 and 1 for each variable
+    counts_A = df_cleaned['_mb1s'].value_counts().to_dict()
+    counts_B = df_cleaned['_mb2s'].value_counts().to_dict()
+
+    return {
+        '_mb1s': {'0': counts_A.get(0, 0), '1': counts_A.get(1, 0)},
+        '_mb2s': {'0': counts_B.get(0, 0), '1': counts_B.get(1, 0)},
+        'cycles': cycles
+    }
+
+def new_brake_counts():
+    return {'_mb1s': {'0': 0, '1': 0}, '_mb2s': {'0': 0, '1': 0}, 'cycles': 0}
+
+def add_brake_counts(total, file_counts):
+    """Add the counts and cycles of file_counts to total."""
+    total['_mb1s']['0'] += file_counts['_mb1s']['0']
+    total['_mb1s']['1'] += file_counts['_mb1s']['1']
+    total['_mb2s']['0'] += file_counts['_mb2s']['0']
+    total['_mb2s']['1'] += file_counts['_mb2s']['1']
+    total['cycles'] += file_counts['cycles']
+
+def count_brake_arrays(mb1s, mb2s, prev_state=None):
+    """Count brake states and cycles with shifted array comparisons, continuing from prev_state if given."""
+    # Prepend the last row of the previous chunk, which was already counted
+    offset = 0
+    if prev_state is not None:
+        mb1s = np.concatenate(([prev_state[0]], mb1s))
+        mb2s = np.concatenate(([prev_state[1]], mb2s))
+        offset = 1
+
+    # A row is kept when its (_mb1s, _mb2s) pair differs from the previous row
+    to_keep = np.ones(len(mb1s), dtype=bool)
+    to_keep[1:] = (mb1s[1:] != mb1s[:-1]) | (mb2s[1:] != mb2s[:-1])
+
+    # A cycle is a (1, 1) -> (0, 0) transition between consecutive rows
+    cycles = np.count_nonzero((mb1s[:-1] == 1) & (mb2s[:-1] == 1) & (mb1s[1:] == 0) & (mb2s[1:] == 0))
+
+    kept_A = mb1s[offset:][to_keep[offset:]]
+    kept_B = mb2s[offset:][to_keep[offset:]]
+
+    return {
+        '_mb1s': {'0': int(np.count_nonzero(kept_A == 0)), '1': int(np.count_nonzero(kept_A == 1))},
+        '_mb2s': {'0': int(np.count_nonzero(kept_B == 0)), '1': int(np.count_nonzero(kept_B == 1))},
+        'cycles': int(cycles)
+    }
+
+def count_brake_states(df):
+    """Count brake states and cycles of a whole file (all zero for a header-only file, as with the loop)."""
+    return count_brake_arrays(df['_mb1s'].to_numpy(), df['_mb2s'].to_numpy())
+
+def count_brake_chunk(state, chunk):
+    """Add one chunk of a streamed file to state, carrying the last (_mb1s, _mb2s) pair across chunks."""
+    if state is None:
+        state = {'counts': new_brake_counts(), 'prev_state': None}
+    if chunk.empty:
+        return state
+
+    mb1s = chunk['_mb1s'].to_numpy()
+    mb2s = chunk['_mb2s'].to_numpy()
+    add_brake_counts(state['counts'], count_brake_arrays(mb1s, mb2s, state['prev_state']))
+    state['prev_state'] = (mb1s[-1], mb2s[-1])
+    return state
+
+def finish_brake_chunks(state):
+    """Counts and cycles of a streamed file, the same as count_brake_states on the whole file."""
+    if state is None:
+        return count_brake_arrays(np.array([]), np.array([]))
+    return state['counts']
+
+def analyze_brake_file(df, filename):
+    """Count brake states and cycles of one CSV file with the selected engine."""
+    if BRAKE_ENGINE == 'loop':
+        return count_brake_states_loop(df)
+
+    file_counts = count_brake_states(df)
+    if BRAKE_ENGINE == 'both':
+        loop_counts = count_brake_states_loop(df)
+        if loop_counts != file_counts:
+            print(f"Engine mismatch in {filename}: vector {file_counts} != loop {loop_counts}")
+    return file_counts
+
+def summarise_lift(files):
+    """Build the lift results from the counts and cycles of each file."""
     results = {
-        'total_counts': {'_mb1s': {'0': 0, '1': 0}, '_mb2s': {'0': 0, '1': 0}, 'cycles': 0},
-        'files': {}
+        'total_counts': new_brake_counts(),
+        'files': files
     }
 
-    # Loop through each CSV file in the lift folder
-    for filename in os.listdir(lift_folder):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(lift_folder, filename)
-            
-            # Check if the file is empty
-            if os.path.getsize(file_path) == 0:
-                print(f"Skipping empty file: {filename}")
-                continue
-            
-            try:
-                df = pd.read_csv(file_path)
-                
-                # Initialize a boolean mask for rows to keep
-                to_keep = [True] * len(df)
-                
-                # Track deletions and cycles
-                deleted_rows = []
-                cycles = 0
-                prev_state = None
-
-                # Compare each row with the previous row to mark continuous duplicates and count cycles
-                for i in range(len(df)):
-                    current_state = (df['_mb1s'].iloc[i], df['_mb2s'].iloc[i])
-                    
-                    if i > 0:
-                        if current_state == prev_state:
-                            to_keep[i] = False
-                            deleted_rows.append(i + 1)  # 1-based index for progress display
-                        elif prev_state == (1, 1) and current_state == (0, 0):
-                            cycles += 1
-                    
-                    prev_state = current_state
-
-                # Drop the marked rows
-                df_cleaned = df[to_keep].reset_index(drop=True)
-            
-                # Count occurrences of 0 and 1 for each variable
-                counts_A = df_cleaned['_mb1s'].value_counts().to_dict()
-                counts_B = df_cleaned['_mb2s'].value_counts().to_dict()
-                
-                # Store counts and cycles in the results under the file name
-                results['files'][filename] = {
-                    '_mb1s': {'0': counts_A.get(0, 0), '1': counts_A.get(1, 0)},
-                    '_mb2s': {'0': counts_B.get(0, 0), '1': counts_B.get(1, 0)},
-                    'cycles': cycles
-                }
-                
-                # Update total counts and cycles
-                results['total_counts']['_mb1s']['0'] += counts_A.get(0, 0)
-                results['total_counts']['_mb1s']['1'] += counts_A.get(1, 0)
-                results['total_counts']['_mb2s']['0'] += counts_B.get(0, 0)
-                results['total_counts']['_mb2s']['1'] += counts_B.get(1, 0)
-                results['total_counts']['cycles'] += cycles
-
-            except pd.errors.EmptyDataError:
-                print(f"Skipping empty file: {filename}")
-            except Exception as e:
-                print(f"Error reading {filename}: {e}")
+    # Update total counts and cycles
+    for file_counts in files.values():
+        add_brake_counts(results['total_counts'], file_counts)
+
+    return results
 
+def export_results(results, lift_name):
+    """Export the lift results to BOCC-<lift>.json."""
     # Create the output directory if it doesn't exist
     os.makedirs(os.path.join(output_directory,"BRAKE OPENING AND CLOSING COUNT"), exist_ok=True)
 
@@ -97,6 +168,25 @@ def analyze_lift(lift_folder, lift_name):
 
     print(f"Counts and cycles exported to {output_file_path}")
 
+def measure_brake_csv(file_path, filename):
+    """Read one CSV file and count its brake states and cycles."""
+    if should_stream(file_path, STREAM_THRESHOLD_MB, CHUNK_ROWS):
+        print(f"Streaming {filename} in chunks of {CHUNK_ROWS} rows")
+        state = None
+        for chunk in iter_telemetry_csv(file_path, usecols=BRAKE_COLUMNS, chunk_rows=CHUNK_ROWS):
+            state = count_brake_chunk(state, chunk)
+        return finish_brake_chunks(state)
+
+    df = read_telemetry_csv(file_path, usecols=BRAKE_COLUMNS)
+    return analyze_brake_file(df, filename)
+
+def analyze_lift(lift_folder, lift_name):
+    """Analyze all CSV files in a given lift folder."""
+    # Store counts and cycles in the results under the file name
+    files = measure_files(lift_folder, lift_name, 'BOCC', measure_brake_csv)
+
+    export_results(summarise_lift(files), lift_name)
+
 def process_all_lifts():
     """Process each lift folder under the main data directory."""
     if not os.path.exists(csv_base_folder):
@@ -105,11 +195,8 @@ def process_all_lifts():
 
     print(f"\nProcessing all lifts in: {csv_base_folder}")
 
-    for lift_folder in os.listdir(csv_base_folder):
-        full_path = os.path.join(csv_base_folder, lift_folder)
-        if os.path.isdir(full_path):
-            print(f"\nAnalyzing lift: {lift_folder}")
-            analyze_lift(full_path, lift_folder)
+    run_lifts(analyze_lift, list_lift_folders(csv_base_folder))
 
-# Run the analysis for all lifts
-process_all_lifts()
+if __name__ == "__main__":
+    # Run the analysis for all lifts
+    process_all_lifts()
@@ -1,7 +1,13 @@
 import pandas as pd
+import numpy as np
 import os
 import json
+import time
 from datetime import datetime
+from lift_pool import list_lift_folders, run_lifts
+from manifest import measure_files
+from measurement_settings import load_settings
+from csv_loader import read_telemetry_csv, iter_telemetry_csv, should_stream, parse_gts
 
 # Define base directories
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -21,67 +27,128 @@ else:
 csv_base_folder = os.path.join(root, csv_dir)
 output_directory = os.path.join(root, out_json_dir)
 
+# Fixed format of the _gts timestamps, so pandas does not infer it per file
+settings = load_settings()
+GTS_FORMAT = settings["gts_format"]
+
+# Files larger than STREAM_THRESHOLD_MB are read in chunks of CHUNK_ROWS rows
+STREAM_THRESHOLD_MB = settings["stream_threshold_mb"]
+CHUNK_ROWS = settings["chunk_rows"]
+
+# Columns read from each CSV file
+DOOR_COLUMNS = ['_gts', '_lds']
+
 # Function to count door cycles
 def count_door_cycles(df):
-    cycles = 0
-    door_open = False
-    for status in df['_lds']:
-        if not door_open and status == 1:
-            door_open = True
-        elif door_open and status == 0:
-            cycles += 1
-            door_open = False
-    return cycles
+    """Count door cycles as 1 -> 0 transitions of _lds, ignoring any other status value."""
+    status = df['_lds'].to_numpy()
+    status = status[(status == 0) | (status == 1)]
+    return int(np.count_nonzero((status[:-1] == 1) & (status[1:] == 0)))
 
-def analyze_lift(lift_folder, lift_name):
-    """Analyze all CSV files in a given lift folder."""
-    results = {
-        'total_cycles': 0,
-        'files': {}
+def new_time_split():
+    """Time spent in each stage, to show where the remaining cost is."""
+    return {'read': 0.0, 'parse': 0.0, 'sort': 0.0, 'count': 0.0, 'unsorted_files': 0}
+
+def print_time_split(lift_name, timings):
+    print(f"Time split for {lift_name}: read {timings['read']:.3f}s, parse {timings['parse']:.3f}s, "
+          f"sort {timings['sort']:.3f}s ({timings['unsorted_files']} unsorted files), count {timings['count']:.3f}s")
+
+def analyze_door_file(df, timings):
+    """Count the door cycles of one CSV file, adding the time of each stage to timings."""
+    # Convert _gts to datetime
+    start = time.perf_counter()
+    door_df = pd.DataFrame({'_gts': parse_gts(df['_gts'], GTS_FORMAT), '_lds': df['_lds']})
+
+    # Drop rows with invalid dates
+    door_df = door_df.dropna(subset=['_gts'])
+    timings['parse'] += time.perf_counter() - start
+
+    # Sort by timestamp, unless the file is already in order
+    start = time.perf_counter()
+    if not door_df['_gts'].is_monotonic_increasing:
+        door_df = door_df.sort_values('_gts', kind='stable')
+        timings['unsorted_files'] += 1
+    timings['sort'] += time.perf_counter() - start
+
+    # Count door cycles
+    start = time.perf_counter()
+    cycles = count_door_cycles(door_df)
+    timings['count'] += time.perf_counter() - start
+
+    return {
+        'cycles': cycles,
+        'date': door_df['_gts'].dt.date.iloc[0].isoformat() if not door_df.empty else None
     }
 
-    # Loop through each CSV file in the lift folder
-    for filename in os.listdir(lift_folder):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(lift_folder, filename)
-            
-            # Check if the file is empty
-            if os.path.getsize(file_path) == 0:
-                print(f"Skipping empty file: {filename}")
-                continue
+def count_door_chunk(state, chunk, timings):
+    """
+    Add one chunk of a streamed file to state, carrying the last door status across chunks.
 
-            # Read the CSV file
-            try:
-                df = pd.read_csv(file_path)
-                
-                # Convert _gts to datetime
-                df['_gts'] = pd.to_datetime(df['_gts'], errors='coerce')
-                
-                # Drop rows with invalid dates
-                df = df.dropna(subset=['_gts'])
-                
-                # Sort by timestamp
-                df = df.sort_values('_gts')
-                
-                # Count door cycles
-                cycles = count_door_cycles(df)
-                
-                # Store cycles in the results under the file name
-                results['files'][filename] = {
-                    'cycles': cycles,
-                    'date': df['_gts'].dt.date.iloc[0].isoformat() if not df.empty else None
-                }
-                
-                # Update total cycles
-                results['total_cycles'] += cycles
-
-                print(f"Processed {filename}: {cycles} cycles")
-
-            except pd.errors.EmptyDataError:
-                print(f"Skipping empty file: {filename}")
-            except Exception as e:
-                print(f"Error reading {filename}: {e}")
+    Streaming only gives the whole-file count when the timestamps are already
+    in order, as the file cannot be sorted chunk by chunk. An out-of-order
+    chunk, or a first timestamp not in GTS_FORMAT, marks the state as not
+    streamable so the caller reads the whole file instead.
+    """
+    if state is None:
+        state = {'cycles': 0, 'prev_status': None, 'last_gts': None, 'date': None,
+                 'checked_format': False, 'streamable': True}
+    if not state['streamable'] or chunk.empty:
+        return state
+
+    start = time.perf_counter()
+    gts = pd.to_datetime(chunk['_gts'], format=GTS_FORMAT, errors='coerce')
+
+    # parse_gts infers the format of a file whose first timestamp does not match
+    if not state['checked_format']:
+        first_valid = chunk['_gts'].first_valid_index()
+        if first_valid is not None:
+            state['checked_format'] = True
+            if pd.isna(gts[first_valid]):
+                state['streamable'] = False
+                return state
+
+    valid = gts.notna().to_numpy()
+    gts = gts[valid]
+    timings['parse'] += time.perf_counter() - start
+    if gts.empty:
+        return state
 
+    if not gts.is_monotonic_increasing or (state['last_gts'] is not None and gts.iloc[0] < state['last_gts']):
+        state['streamable'] = False
+        return state
+
+    start = time.perf_counter()
+    if state['date'] is None:
+        state['date'] = gts.iloc[0].date().isoformat()
+    state['last_gts'] = gts.iloc[-1]
+
+    status = chunk['_lds'].to_numpy()[valid]
+    status = status[(status == 0) | (status == 1)]
+    if state['prev_status'] is not None:
+        status = np.concatenate(([state['prev_status']], status))
+    if len(status):
+        state['cycles'] += int(np.count_nonzero((status[:-1] == 1) & (status[1:] == 0)))
+        state['prev_status'] = status[-1]
+    timings['count'] += time.perf_counter() - start
+    return state
+
+def finish_door_chunks(state):
+    """Cycles of a streamed file as analyze_door_file gives them, or None when it must be read whole."""
+    if state is None:
+        return {'cycles': 0, 'date': None}
+    if not state['streamable']:
+        return None
+    return {'cycles': state['cycles'], 'date': state['date']}
+
+def summarise_lift(files):
+    """Build the lift results from the cycles of each file."""
+    return {
+        'total_cycles': sum(file_cycles['cycles'] for file_cycles in files.values()),
+        'files': files
+    }
+
+def export_results(results, lift_name):
+    """Export the lift results to DC-<lift>.json."""
     # Ensure the output directory exists
     if not os.path.exists(os.path.join(output_directory, "DOOR OPENING AND CLOSING CYCLE COUNT")):
         os.makedirs(os.path.join(output_directory, "DOOR OPENING AND CLOSING CYCLE COUNT"), exist_ok=True)
@@ -93,6 +160,39 @@ def analyze_lift(lift_folder, lift_name):
 
     print(f"Door cycles count exported to {output_file_path}")
 
+def analyze_lift(lift_folder, lift_name):
+    """Analyze all CSV files in a given lift folder."""
+    timings = new_time_split()
+
+    def measure_door_csv(file_path, filename):
+        file_cycles = None
+        if should_stream(file_path, STREAM_THRESHOLD_MB, CHUNK_ROWS):
+            print(f"Streaming {filename} in chunks of {CHUNK_ROWS} rows")
+            state = None
+            for chunk in iter_telemetry_csv(file_path, usecols=DOOR_COLUMNS, chunk_rows=CHUNK_ROWS):
+                state = count_door_chunk(state, chunk, timings)
+                if not state['streamable']:
+                    break
+            file_cycles = finish_door_chunks(state)
+            if file_cycles is None:
+                print(f"Timestamps of {filename} are out of order or in another format, reading the whole file")
+
+        if file_cycles is None:
+            # Read the CSV file
+            start = time.perf_counter()
+            df = read_telemetry_csv(file_path, usecols=DOOR_COLUMNS)
+            timings['read'] += time.perf_counter() - start
+
+            file_cycles = analyze_door_file(df, timings)
+        print(f"Processed {filename}: {file_cycles['cycles']} cycles")
+        return file_cycles
+
+    # Store cycles in the results under the file name
+    files = measure_files(lift_folder, lift_name, 'DC', measure_door_csv)
+
+    print_time_split(lift_name, timings)
+    export_results(summarise_lift(files), lift_name)
+
 def process_all_lifts():
     """Process each lift folder under the main data directory."""
     # Navigate to the correct base folder
@@ -104,13 +204,8 @@ def process_all_lifts():
     else:
         print(f"\nCurrent directory: {current_csv_dir}")
 
-    for lift_folder in os.listdir():
-        full_path = os.path.join(current_csv_dir, lift_folder)
-        print(f"Full Path: {full_path}")
-        print(f"Lift Folder: {lift_folder}")
-        if os.path.isdir(full_path):
-            print(f"\nAnalyzing lift: {lift_folder}")
-            analyze_lift(full_path, lift_folder)
+    run_lifts(analyze_lift, list_lift_folders(current_csv_dir))
 
-# Run the analysis for all lifts
-process_all_lifts()
+if __name__ == "__main__":
+    # Run the analysis for all lifts
+    process_all_lifts()
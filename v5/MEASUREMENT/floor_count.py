@@ -1,7 +1,11 @@
 import os
-import pandas as pd
+import numpy as np
 import json
 from collections import OrderedDict
+from lift_pool import list_lift_folders, run_lifts
+from manifest import measure_files
+from measurement_settings import load_settings
+from csv_loader import read_telemetry_csv, iter_telemetry_csv, should_stream
 
 # Limitation: Data acquired without identify the door opening and closing
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -35,43 +39,93 @@ def process_all_lifts():
             print(f"\nAnalyzing lift: {lift_folder}")
             process_lift_data(full_path, lift_folder)
 
+# Files larger than STREAM_THRESHOLD_MB are read in chunks of CHUNK_ROWS rows
+settings = load_settings()
+STREAM_THRESHOLD_MB = settings["stream_threshold_mb"]
+CHUNK_ROWS = settings["chunk_rows"]
+
+# Columns read from each CSV file
+FLOOR_COLUMNS = ['_mb1s', '_mb2s', '_lfls']
+
+def floor_key(floor):
+    """Key of a floor in FC-*.json: '3' for 3, 3.0 or '3.0' (_lfls reads as float when it has blank cells)."""
+    value = float(floor)
+    return str(int(value)) if value.is_integer() else str(floor)
+
+def count_floor_stops(data, prev_state=(1, 1)):
+    """Count lift stops per floor in a single CSV file, or in a chunk following a row in prev_state."""
+    mb1s = data['_mb1s'].to_numpy()
+    mb2s = data['_mb2s'].to_numpy()
+
+    # Previous state of each row, assuming the lift starts in moving state
+    prev_mb1s = np.concatenate(([prev_state[0]], mb1s[:-1]))
+    prev_mb2s = np.concatenate(([prev_state[1]], mb2s[:-1]))
+
+    # Lift has stopped where both mb1s and mb2s toggle from 1 to 0
+    stopped = (prev_mb1s == 1) & (prev_mb2s == 1) & (mb1s == 0) & (mb2s == 0)
+
+    # Histogram of the floors the lift stopped at, keyed as in FC-*.json
+    stop_floors = data['_lfls'][stopped].value_counts(sort=False)
+    return {floor_key(floor): count for floor, count in zip(stop_floors.index.tolist(), stop_floors.tolist())}
+
+def count_floor_chunk(state, chunk):
+    """Add one chunk of a streamed file to state, carrying the last (_mb1s, _mb2s) pair across chunks."""
+    if state is None:
+        state = {'counts': {}, 'prev_state': (1, 1)}
+    if chunk.empty:
+        return state
+
+    for floor, count in count_floor_stops(chunk, state['prev_state']).items():
+        state['counts'][floor] = state['counts'].get(floor, 0) + count
+    state['prev_state'] = (chunk['_mb1s'].iloc[-1], chunk['_mb2s'].iloc[-1])
+    return state
+
+def finish_floor_chunks(state):
+    """Floor stops of a streamed file, the same as count_floor_stops on the whole file."""
+    return state['counts'] if state is not None else {}
+
+def measure_floor_csv(file_path, filename):
+    """Read one CSV file and count its floor stops."""
+    if should_stream(file_path, STREAM_THRESHOLD_MB, CHUNK_ROWS):
+        print(f"Streaming {filename} in chunks of {CHUNK_ROWS} rows")
+        state = None
+        for chunk in iter_telemetry_csv(file_path, usecols=FLOOR_COLUMNS, chunk_rows=CHUNK_ROWS):
+            state = count_floor_chunk(state, chunk)
+        return finish_floor_chunks(state)
+
+    data = read_telemetry_csv(file_path, usecols=FLOOR_COLUMNS)
+    return count_floor_stops(data)
+
 def process_lift_data(lift_folder, lift_name):
-    floor_counts = {}
-    files_output = {}
-
-    for filename in os.listdir(lift_folder):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(lift_folder, filename)
-            data = pd.read_csv(file_path)
-            
-            file_floor_counts = {}
-            prev_mb1s = prev_mb2s = 1  # Assume lift starts in moving state
-            
-            for _, row in data.iterrows():
-                current_mb1s = row['_mb1s']
-                current_mb2s = row['_mb2s']
-                current_floor = row['_lfls']
-                
-                # Check if lift has stopped (both mb1s and mb2s toggle from 1 to 0)
-                if prev_mb1s == 1 and prev_mb2s == 1 and current_mb1s == 0 and current_mb2s == 0:
-                    floor_counts[current_floor] = floor_counts.get(current_floor, 0) + 1
-                    file_floor_counts[current_floor] = file_floor_counts.get(current_floor, 0) + 1
-                
-                prev_mb1s, prev_mb2s = current_mb1s, current_mb2s
-            
-            files_output[filename] = file_floor_counts
+    files_output = measure_files(lift_folder, lift_name, 'FC', measure_floor_csv, skip_errors=False)
 
+    floor_counts = summarise_lift(files_output)
     return floor_counts, files_output, lift_name
 
+def summarise_lift(files_output):
+    """Merge the per-file histograms into the lift total."""
+    floor_counts = {}
+    for file_floor_counts in files_output.values():
+        for floor, count in file_floor_counts.items():
+            floor_counts[floor_key(floor)] = floor_counts.get(floor_key(floor), 0) + count
+    return floor_counts
+
+def sorted_floor_counts(floor_counts):
+    """Floor histogram ordered by floor number, merging keys such as '3.0' from older manifests into '3'."""
+    merged = {}
+    for floor, count in floor_counts.items():
+        merged[floor_key(floor)] = merged.get(floor_key(floor), 0) + count
+    return OrderedDict(sorted(merged.items(), key=lambda x: float(x[0])))
+
 def sort_floor_numbers(data):
     # Sort total floor numbers
     total_floors = data["total of floor number travelled by the lift"]
-    sorted_total = OrderedDict(sorted(total_floors.items(), key=lambda x: int(x[0])))
+    sorted_total = sorted_floor_counts(total_floors)
     data["total of floor number travelled by the lift"] = sorted_total
 
     # Sort floor numbers for each file
     for file_name, file_data in data["files"].items():
-        sorted_file_data = OrderedDict(sorted(file_data.items(), key=lambda x: int(x[0])))
+        sorted_file_data = sorted_floor_counts(file_data)
         data["files"][file_name] = sorted_file_data
 
     return data
@@ -92,6 +146,12 @@ def output_to_json(floor_counts, files_output, lift_name):
         json.dump(output_data, json_file, indent=4)
 
     print(f"Counts and cycles exported to {output_file_path}")
+    return output_file_path
+
+def analyze_lift(lift_folder, lift_name):
+    """Count the floor stops of a lift and export them to FC-<lift>.json."""
+    floor_counts, files_output, lift_name = process_lift_data(lift_folder, lift_name)
+    output_to_json(floor_counts, files_output, lift_name)
 
 def main():
     # Verify that `csv_base_folder` exists
@@ -102,17 +162,7 @@ def main():
     print(f"\nProcessing all lifts in: {csv_base_folder}")
     
     # Process each lift folder in the base folder
-    for lift_folder in os.listdir(csv_base_folder):
-        full_path = os.path.join(csv_base_folder, lift_folder)
-        if os.path.isdir(full_path):  # Only process directories
-            try:
-                print(f"\nAnalyzing lift: {lift_folder}")
-                floor_counts, files_output, lift_name = process_lift_data(full_path, lift_folder)
-                output_to_json(floor_counts, files_output, lift_name)
-            except FileNotFoundError:
-                print(f"Error: The specified folder path '{full_path}' does not exist.")
-            except Exception as e:
-                print(f"An error occurred while processing {lift_folder}: {str(e)}")
+    run_lifts(analyze_lift, list_lift_folders(csv_base_folder))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,68 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from measurement_settings import load_settings
+
+# Run the analysis of each lift folder, in parallel when more than one worker is configured
+
+def get_worker_count():
+    """Number of worker processes from settings.json ("workers": 1 runs sequentially, 0 uses every core)."""
+    workers = load_settings()["workers"]
+    if not workers:
+        workers = os.cpu_count() or 1
+    return int(workers)
+
+def list_lift_folders(csv_base_folder):
+    """List (full path, lift name) of each lift folder under the base folder."""
+    lifts = []
+    for lift_folder in os.listdir(csv_base_folder):
+        full_path = os.path.join(csv_base_folder, lift_folder)
+        if os.path.isdir(full_path):
+            lifts.append((full_path, lift_folder))
+    return lifts
+
+def run_lifts(analyze, lifts, workers=None):
+    """
+    Run analyze(full_path, lift_name) for each lift and report the failures.
+
+    Each call writes its own JSON output, so lifts are independent. A failing
+    lift is reported without aborting the others.
+
+    Parameters:
+    - analyze (callable): Module-level function, so it can be sent to worker processes.
+    - lifts (list): (full path, lift name) of each lift folder.
+    - workers (int): Number of worker processes, read from settings.json when None.
+
+    Returns:
+    - dict: Error message of each lift that failed.
+    """
+    if workers is None:
+        workers = get_worker_count()
+
+    failures = {}
+
+    if workers <= 1 or len(lifts) <= 1:
+        for full_path, lift_name in lifts:
+            print(f"\nAnalyzing lift: {lift_name}")
+            try:
+                analyze(full_path, lift_name)
+            except Exception as e:
+                print(f"An error occurred while processing {lift_name}: {e}")
+                failures[lift_name] = str(e)
+    else:
+        print(f"\nAnalyzing {len(lifts)} lifts with {workers} worker processes")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(analyze, full_path, lift_name): lift_name for full_path, lift_name in lifts}
+            for future in as_completed(futures):
+                lift_name = futures[future]
+                try:
+                    future.result()
+                    print(f"Finished lift: {lift_name}")
+                except Exception as e:
+                    print(f"An error occurred while processing {lift_name}: {e}")
+                    failures[lift_name] = str(e)
+
+    print(f"\nLifts processed: {len(lifts) - len(failures)}, failed: {len(failures)}")
+    for lift_name, error in failures.items():
+        print(f"- {lift_name}: {error}")
+
+    return failures
@@ -0,0 +1,131 @@
+import os
+import json
+import pandas as pd
+from measurement_settings import load_settings
+from csv_loader import DEFAULT_ENGINE
+
+# Per lift and metric record of the CSV files already measured, so that
+# only new or changed files are measured again
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DIR_PATH = os.path.join(BASE_DIR, 'JSON', 'dir.json')
+if os.path.exists(DIR_PATH):
+        with open(DIR_PATH, 'r') as file:
+            try:
+                dir_path_data = json.load(file)
+                root = dir_path_data["root"]
+                out_json_dir = dir_path_data["measurement"][2]["measurement_data_analysis"]
+            except json.JSONDecodeError:
+                print("\ndir.json existed but unable to load files.")
+else:
+    print("\nfile_path.json is not existed.")
+
+manifest_directory = os.path.join(root, out_json_dir, "MANIFEST")
+
+# Reuse the results recorded in the manifests ("incremental": false measures every file again)
+INCREMENTAL = load_settings()["incremental"]
+
+# Settings the results depend on; a manifest recorded under other values is not reused
+RESULT_SETTINGS = dict({key: load_settings()[key] for key in
+                        ('brake_engine', 'gts_format', 'stream_threshold_mb', 'chunk_rows')},
+                       csv_engine=DEFAULT_ENGINE)
+
+def file_signature(file_path):
+    """Size and modification time identifying the content of a CSV file."""
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+def manifest_path(metric, lift_name):
+    return os.path.join(manifest_directory, f'{metric}-{lift_name}.json')
+
+def load_manifest(metric, lift_name):
+    """Load the {filename: {'size', 'mtime', 'result'}} records of a lift and metric."""
+    path = manifest_path(metric, lift_name)
+    if not INCREMENTAL or not os.path.exists(path):
+        return {}
+
+    with open(path, 'r') as file:
+        try:
+            manifest = json.load(file)
+            files = manifest['files']
+        except (json.JSONDecodeError, KeyError):
+            print(f"\n{path} existed but unable to load files. Measuring all files again.")
+            return {}
+
+    if manifest.get('settings') != RESULT_SETTINGS:
+        print(f"\n{path} was recorded with other settings. Measuring all files again.")
+        return {}
+    return files
+
+def cached_result(manifest, filename, signature):
+    """Result recorded for a file, or None when the file is new or changed."""
+    record = manifest.get(filename)
+    if record and record['size'] == signature['size'] and record['mtime'] == signature['mtime']:
+        return record['result']
+    return None
+
+def save_manifest(metric, lift_name, manifest, records):
+    """Write the records of the files measured in this run, retracting the removed files."""
+    removed = [filename for filename in manifest if filename not in records]
+    for filename in removed:
+        print(f"Retracting removed file from {metric}-{lift_name}: {filename}")
+
+    os.makedirs(manifest_directory, exist_ok=True)
+
+    # Write to a temporary file first so an interrupted run never leaves a partial manifest
+    path = manifest_path(metric, lift_name)
+    with open(path + '.tmp', 'w') as file:
+        json.dump({'settings': RESULT_SETTINGS, 'files': records}, file, indent=4)
+    os.replace(path + '.tmp', path)
+
+def measure_files(lift_folder, lift_name, metric, measure, skip_errors=True):
+    """
+    Measure every CSV file of a lift, reusing the manifest results of unchanged files.
+
+    Totals are always rebuilt from the returned per-file results, so files
+    that were removed from the folder are retracted from them.
+
+    Parameters:
+    - lift_folder (str): Path to the lift folder.
+    - lift_name (str): Name of the lift.
+    - metric (str): Prefix of the metric output, e.g. 'BOCC'.
+    - measure (callable): measure(file_path, filename) returning the result of one file.
+    - skip_errors (bool): Skip files that fail to be measured, otherwise raise the error.
+
+    Returns:
+    - dict: Result of each CSV file, in folder listing order.
+    """
+    manifest = load_manifest(metric, lift_name)
+    records = {}
+    files = {}
+    reused = 0
+
+    for filename in os.listdir(lift_folder):
+        if not filename.endswith('.csv'):
+            continue
+
+        file_path = os.path.join(lift_folder, filename)
+        signature = file_signature(file_path)
+
+        result = cached_result(manifest, filename, signature)
+        if result is not None:
+            reused += 1
+        else:
+            try:
+                result = measure(file_path, filename)
+            except Exception as e:
+                if not skip_errors:
+                    raise
+                if isinstance(e, pd.errors.EmptyDataError):
+                    print(f"Skipping empty file: {filename}")
+                else:
+                    print(f"Error reading {filename}: {e}")
+                continue
+
+        files[filename] = result
+        records[filename] = dict(signature, result=result)
+
+    if reused:
+        print(f"Reused {reused} of {len(files)} files from the {metric}-{lift_name} manifest")
+
+    save_manifest(metric, lift_name, manifest, records)
+    return files
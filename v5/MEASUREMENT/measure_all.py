@@ -0,0 +1,215 @@
+import os
+import time
+import pandas as pd
+
+import brake_count
+import door_count
+import floor_count
+import mileage_floor
+import mode_floor_count
+from lift_pool import list_lift_folders, run_lifts
+from manifest import cached_result, file_signature, load_manifest, save_manifest
+from measurement_settings import load_settings
+from csv_loader import read_telemetry_csv, iter_telemetry_csv, should_stream
+
+# Read every deduplicated CSV once and feed it to all measurement tools.
+# Writes the same BOCC, DC, FC, MFC and M JSON files as running
+# brake_count.py, door_count.py, floor_count.py, mode_floor_count.py and
+# mileage_floor.py one after another.
+csv_base_folder = floor_count.csv_base_folder
+output_directory = floor_count.output_directory
+
+# Manifest prefix of each metric; MFC is derived from the FC output
+METRICS = ['BOCC', 'DC', 'FC', 'M']
+
+# Metrics only exported when every file of the lift can be measured
+ALL_FILES_METRICS = ['FC', 'M']
+
+# Columns read once for all metrics
+MEASURE_COLUMNS = ['_gts', '_mb1s', '_mb2s', '_lfls', '_lds']
+
+# Files larger than STREAM_THRESHOLD_MB are read in chunks of CHUNK_ROWS rows
+settings = load_settings()
+STREAM_THRESHOLD_MB = settings["stream_threshold_mb"]
+CHUNK_ROWS = settings["chunk_rows"]
+
+def export_floor_and_mode(floor_files, lift_name):
+    """Export FC-<lift>.json and derive MFC-<lift> from it, as mode_floor_count.py does."""
+    fc_json_path = floor_count.output_to_json(floor_count.summarise_lift(floor_files), floor_files, lift_name)
+
+    data = mode_floor_count.read_json_file(fc_json_path)
+    total_mode, file_modes = mode_floor_count.calculate_modes(data)
+
+    # mode_floor_count.py names its output after the FC file, and the graph reads MFC-<lift>.json.json
+    mode_floor_count.write_results_to_json(total_mode, file_modes, output_directory, f"{lift_name}.json")
+
+def measure_metric(metric, df, filename, timings):
+    """Measure one metric of a CSV file that was already read."""
+    if metric == 'BOCC':
+        return brake_count.analyze_brake_file(df, filename)
+    if metric == 'DC':
+        return door_count.analyze_door_file(df, timings)
+    if metric == 'FC':
+        return floor_count.count_floor_stops(df)
+    return mileage_floor.calculate_mileage(df)
+
+def add_metric_chunk(metric, state, chunk, timings):
+    """Add one chunk of a streamed CSV file to the state of a metric."""
+    if metric == 'BOCC':
+        return brake_count.count_brake_chunk(state, chunk)
+    if metric == 'DC':
+        return door_count.count_door_chunk(state, chunk, timings)
+    if metric == 'FC':
+        return floor_count.count_floor_chunk(state, chunk)
+    return mileage_floor.calculate_mileage_chunk(state, chunk)
+
+def stream_metrics(file_path, needed, timings):
+    """Feed each chunk of a CSV file to every needed metric, keeping the error of a metric that fails."""
+    states = {metric: None for metric in needed}
+    for chunk in iter_telemetry_csv(file_path, usecols=MEASURE_COLUMNS, chunk_rows=CHUNK_ROWS):
+        for metric in needed:
+            if isinstance(states[metric], Exception):
+                continue
+            try:
+                states[metric] = add_metric_chunk(metric, states[metric], chunk, timings)
+            except Exception as e:
+                states[metric] = e
+    return states
+
+def finish_metric(metric, state, file_path, timings):
+    """Result of a metric of a streamed CSV file."""
+    if isinstance(state, Exception):
+        raise state
+    if metric == 'BOCC':
+        return brake_count.finish_brake_chunks(state)
+    if metric == 'DC':
+        result = door_count.finish_door_chunks(state)
+        if result is None:
+            # Out of order timestamps need the whole _gts column to be sorted
+            df = read_telemetry_csv(file_path, usecols=door_count.DOOR_COLUMNS)
+            result = door_count.analyze_door_file(df, timings)
+        return result
+    if metric == 'FC':
+        return floor_count.finish_floor_chunks(state)
+    return mileage_floor.finish_mileage_chunks(state)
+
+def measure_lift(lift_folder, lift_name):
+    """Measure all metrics of a lift, reading each CSV file at most once."""
+    timings = door_count.new_time_split()
+    manifests = {metric: load_manifest(metric, lift_name) for metric in METRICS}
+    files = {metric: {} for metric in METRICS}
+    records = {metric: {} for metric in METRICS}
+
+    # Error that stopped a metric measuring every file of the lift
+    failed = {}
+    mileage_lift_name = None
+
+    for filename in os.listdir(lift_folder):
+        if not filename.endswith('.csv'):
+            continue
+
+        file_path = os.path.join(lift_folder, filename)
+        signature = file_signature(file_path)
+
+        # mileage_floor.py takes the lift name from the CSV filenames
+        parts = filename.split('-')
+        if len(parts) > 1:
+            mileage_lift_name = parts[1].strip()
+
+        # Reuse the manifest results and read the file only for the metrics that still need it
+        needed = []
+        for metric in METRICS:
+            result = cached_result(manifests[metric], filename, signature)
+            if result is not None:
+                files[metric][filename] = result
+                records[metric][filename] = dict(signature, result=result)
+            elif metric not in failed:
+                needed.append(metric)
+
+        if not needed:
+            continue
+
+        try:
+            if should_stream(file_path, STREAM_THRESHOLD_MB, CHUNK_ROWS):
+                print(f"Streaming {filename} in chunks of {CHUNK_ROWS} rows")
+                states = stream_metrics(file_path, needed, timings)
+            else:
+                states = None
+                start = time.perf_counter()
+                df = read_telemetry_csv(file_path, usecols=MEASURE_COLUMNS)
+                timings['read'] += time.perf_counter() - start
+        except Exception as e:
+            print(f"Error reading {filename}: {e}")
+            for metric in needed:
+                if metric in ALL_FILES_METRICS:
+                    failed[metric] = e
+            continue
+
+        for metric in needed:
+            try:
+                if states is not None:
+                    result = finish_metric(metric, states[metric], file_path, timings)
+                else:
+                    result = measure_metric(metric, df, filename, timings)
+            except pd.errors.EmptyDataError:
+                print(f"Skipping empty file for {metric}: {filename}")
+                continue
+            except Exception as e:
+                print(f"{metric} error in {filename}: {e}")
+                if metric in ALL_FILES_METRICS:
+                    failed[metric] = e
+                continue
+
+            files[metric][filename] = result
+            records[metric][filename] = dict(signature, result=result)
+
+    door_count.print_time_split(lift_name, timings)
+
+    for metric in METRICS:
+        if metric not in failed:
+            save_manifest(metric, lift_name, manifests[metric], records[metric])
+
+    brake_count.export_results(brake_count.summarise_lift(files['BOCC']), lift_name)
+    door_count.export_results(door_count.summarise_lift(files['DC']), lift_name)
+
+    if 'FC' not in failed:
+        try:
+            export_floor_and_mode(files['FC'], lift_name)
+        except Exception as e:
+            print(f"An error occurred while exporting the floor count of {lift_name}: {e}")
+    else:
+        print(f"Floor count and mode of {lift_name} not exported: {failed['FC']}")
+
+    if 'M' not in failed and mileage_lift_name is not None:
+        total_mileage = sum(files['M'].values())
+        mileage_floor.output_to_json(total_mileage, files['M'], output_directory, mileage_lift_name)
+    else:
+        print(f"Mileage of {lift_name} not exported: {failed.get('M', 'no CSV files')}")
+
+def measure_base_file(file_path, filename):
+    """Measure a CSV file placed directly in the base folder (mileage only, as in mileage_floor.py)."""
+    try:
+        mileage = mileage_floor.measure_mileage_csv(file_path, filename)
+        lift_name = os.path.splitext(filename)[0]  # Use filename (without extension) as lift name
+        mileage_floor.output_to_json(mileage, {filename: mileage}, output_directory, lift_name)
+    except Exception as e:
+        print(f"An error occurred with file '{filename}': {e}")
+
+def main():
+    if not os.path.exists(csv_base_folder):
+        print(f"\nError: The directory {csv_base_folder} does not exist.")
+        return
+
+    print(f"\nProcessing all lifts in: {csv_base_folder}")
+
+    run_lifts(measure_lift, list_lift_folders(csv_base_folder))
+
+    for item in os.listdir(csv_base_folder):
+        item_path = os.path.join(csv_base_folder, item)
+
+        if item.endswith('.csv') and os.path.isfile(item_path):
+            print(f"\nProcessing file: {item}")
+            measure_base_file(item_path, item)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+
+# Settings shared by the measurement tools, read from JSON/settings.json
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SETTINGS_PATH = os.path.join(BASE_DIR, 'JSON', 'settings.json')
+
+# The measurement scripts import the shared modules in the v5 root (csv_loader.py)
+# after this module
+V5_ROOT = os.path.dirname(BASE_DIR)
+if V5_ROOT not in sys.path:
+    sys.path.append(V5_ROOT)
+
+DEFAULT_SETTINGS = {
+    # Brake counting engine: 'vector', 'loop' (original row loop) or 'both' (cross-check)
+    "brake_engine": "vector",
+    # Fixed format of the _gts timestamps
+    "gts_format": "%Y-%m-%d %H:%M:%S",
+    # Worker processes across lift folders: 1 runs sequentially, 0 uses every core
+    "workers": 1,
+    # Reuse the per-file results recorded in the manifests
+    "incremental": True,
+    # Files larger than this are streamed in chunks of chunk_rows rows (0 disables streaming)
+    "stream_threshold_mb": 512,
+    "chunk_rows": 1000000
+}
+
+def load_settings():
+    """Load settings.json, falling back to DEFAULT_SETTINGS for missing keys."""
+    settings = dict(DEFAULT_SETTINGS)
+    if os.path.exists(SETTINGS_PATH):
+        with open(SETTINGS_PATH, 'r') as file:
+            try:
+                settings.update(json.load(file))
+            except json.JSONDecodeError:
+                print("\nsettings.json existed but unable to load files.")
+    return settings
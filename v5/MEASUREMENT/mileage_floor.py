@@ -1,6 +1,10 @@
 import os
-import pandas as pd
+import numpy as np
 import json
+from lift_pool import list_lift_folders, run_lifts
+from manifest import measure_files
+from measurement_settings import load_settings
+from csv_loader import read_telemetry_csv, iter_telemetry_csv, should_stream
 
 def get_folder_path():
     # Global variable for folder path
@@ -23,48 +27,101 @@ def get_folder_path():
     return csv_base_folder, output_directory
 
 
-def calculate_mileage(df):
-    mileage = 0
-    origin = None
-    prev_mb1s = prev_mb2s = 0
+# Files larger than STREAM_THRESHOLD_MB are read in chunks of CHUNK_ROWS rows
+settings = load_settings()
+STREAM_THRESHOLD_MB = settings["stream_threshold_mb"]
+CHUNK_ROWS = settings["chunk_rows"]
 
-    for _, row in df.iterrows():
-        current_floor = int(row['_lfls'])
-        current_mb1s = int(row['_mb1s'])
-        current_mb2s = int(row['_mb2s'])
+# Columns read from each CSV file
+MILEAGE_COLUMNS = ['_mb1s', '_mb2s', '_lfls']
 
-        if origin is None:
-            origin = current_floor
+def measure_trips(df, prev_state=(0, 0), origin=None):
+    """
+    Calculate the floor mileage of a chunk following a row in prev_state.
 
-        if prev_mb1s == 0 and prev_mb2s == 0 and current_mb1s == 1 and current_mb2s == 1:
-            # Lift starts moving
-            origin = current_floor
-        elif prev_mb1s == 1 and prev_mb2s == 1 and current_mb1s == 0 and current_mb2s == 0:
-            # Lift stops
-            mileage += abs(current_floor - origin)
-            origin = current_floor
+    origin is the floor of the last start or stop before the chunk, None
+    before the first row of the file. Returns the mileage of the chunk and
+    the origin to carry into the next chunk.
+    """
+    if df.empty:
+        return 0, origin
 
-        prev_mb1s, prev_mb2s = current_mb1s, current_mb2s
+    floors = df['_lfls'].astype('int64').to_numpy()
+    mb1s = df['_mb1s'].astype('int64').to_numpy()
+    mb2s = df['_mb2s'].astype('int64').to_numpy()
 
-    return mileage
+    prev_mb1s = np.concatenate(([prev_state[0]], mb1s[:-1]))
+    prev_mb2s = np.concatenate(([prev_state[1]], mb2s[:-1]))
 
-def process_csv_files(csv_base_folder):
-    total_mileage = 0
-    file_mileages = {}
+    starts = (prev_mb1s == 0) & (prev_mb2s == 0) & (mb1s == 1) & (mb2s == 1)
+    stops = (prev_mb1s == 1) & (prev_mb2s == 1) & (mb1s == 0) & (mb2s == 0)
+
+    # Both starts and stops reset the origin; the first origin is the first row of the file
+    if origin is None:
+        origin = floors[0]
+    events = np.flatnonzero(starts | stops)
+    if len(events) == 0:
+        return 0, origin
 
-    for filename in os.listdir(csv_base_folder):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(csv_base_folder, filename)
+    origins = np.concatenate(([origin], floors[events[:-1]]))
+    trips = np.abs(floors[events] - origins)
 
-            # Extract lift name from the filename
-            parts = filename.split('-')
-            if len(parts) > 1:
-                lift_name = parts[1].strip()
+    return int(trips[stops[events]].sum()), floors[events[-1]]
 
-            df = pd.read_csv(file_path)
-            mileage = calculate_mileage(df)
-            total_mileage += mileage
-            file_mileages[filename] = mileage
+def calculate_mileage(df):
+    """
+    Calculate the floor mileage travelled in a single CSV file.
+
+    A trip starts at a (0,0) -> (1,1) transition of (_mb1s, _mb2s) and ends at
+    a (1,1) -> (0,0) transition, adding abs(destination - origin) floors.
+
+    Files are measured on their own, with the lift assumed stopped before the
+    first row. A file that begins mid-trip takes the floor of its first row as
+    the trip origin, so travel before the file began is not counted. A trip
+    still open at the end of the file is not counted either.
+    """
+    # The lift is assumed stopped before the first row
+    mileage, _ = measure_trips(df)
+    return mileage
+
+def calculate_mileage_chunk(state, chunk):
+    """Add one chunk of a streamed file to state, carrying the last (_mb1s, _mb2s) pair and trip origin."""
+    if state is None:
+        state = {'mileage': 0, 'prev_state': (0, 0), 'origin': None}
+    if chunk.empty:
+        return state
+
+    mileage, state['origin'] = measure_trips(chunk, state['prev_state'], state['origin'])
+    state['mileage'] += mileage
+    state['prev_state'] = (int(chunk['_mb1s'].iloc[-1]), int(chunk['_mb2s'].iloc[-1]))
+    return state
+
+def finish_mileage_chunks(state):
+    """Mileage of a streamed file, the same as calculate_mileage on the whole file."""
+    return state['mileage'] if state is not None else 0
+
+def measure_mileage_csv(file_path, filename):
+    """Read one CSV file and calculate its mileage."""
+    if should_stream(file_path, STREAM_THRESHOLD_MB, CHUNK_ROWS):
+        print(f"Streaming {filename} in chunks of {CHUNK_ROWS} rows")
+        state = None
+        for chunk in iter_telemetry_csv(file_path, usecols=MILEAGE_COLUMNS, chunk_rows=CHUNK_ROWS):
+            state = calculate_mileage_chunk(state, chunk)
+        return finish_mileage_chunks(state)
+
+    df = read_telemetry_csv(file_path, usecols=MILEAGE_COLUMNS)
+    return calculate_mileage(df)
+
+def process_csv_files(csv_base_folder):
+    file_mileages = measure_files(csv_base_folder, os.path.basename(csv_base_folder), 'M',
+                                  measure_mileage_csv, skip_errors=False)
+    total_mileage = sum(file_mileages.values())
+
+    for filename in file_mileages:
+        # Extract lift name from the filename
+        parts = filename.split('-')
+        if len(parts) > 1:
+            lift_name = parts[1].strip()
 
     return total_mileage, file_mileages, lift_name
 
@@ -82,28 +139,30 @@ def output_to_json(total_mileage, file_mileages, output_directory, lift_name):
 
     print(f"Results have been written to {output_file}")
 
+def analyze_folder(item_path, item):
+    """Calculate the mileage of a lift folder and export it to M-<lift>.json."""
+    _, output_directory = get_folder_path()
+    total_mileage, file_mileages, lift_name = process_csv_files(item_path)
+    output_to_json(total_mileage, file_mileages, output_directory, lift_name)
+
 def main():
     csv_base_folder, output_directory = get_folder_path()
 
     print(f"\nProcessing all lifts in: {csv_base_folder}")
 
+    # Process directories containing CSV files
+    run_lifts(analyze_folder, list_lift_folders(csv_base_folder))
+
     for item in os.listdir(csv_base_folder):
         item_path = os.path.join(csv_base_folder, item)
 
         if os.path.isdir(item_path):
-            # Process directories containing CSV files
-            print(f"Processing folder: {item}")
-            try:
-                total_mileage, file_mileages, lift_name = process_csv_files(item_path)
-                output_to_json(total_mileage, file_mileages, output_directory, lift_name)
-            except Exception as e:
-                print(f"An error occurred in folder '{item}': {e}")
+            continue
         elif item.endswith('.csv'):
             # Process individual CSV files in the base folder
             print(f"Processing file: {item}")
             try:
-                df = pd.read_csv(item_path)
-                mileage = calculate_mileage(df)
+                mileage = measure_mileage_csv(item_path, item)
                 lift_name = os.path.splitext(item)[0]  # Use filename (without extension) as lift name
                 file_mileages = {item: mileage}
                 total_mileage = mileage
@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+import warnings
+import numpy as np
+import pandas as pd
+
+# Shared loader for the telemetry CSVs used by MEASUREMENT and DOWNLOAD.
+# Reads only the requested columns with compact dtypes, using the
+# multithreaded pyarrow parser when it is installed.
+
+# Compact dtypes of the telemetry columns (brake and door flags, floor number)
+TELEMETRY_DTYPES = {
+    '_mb1s': 'int8',
+    '_mb2s': 'int8',
+    '_lds': 'int8',
+    '_lfls': 'int16',
+}
+
+# Columns read as text. The C parser keeps their text as it is in the file; the
+# pyarrow parser still parses timestamp-like values first, so e.g. '10:00:00.5'
+# comes back as '10:00:00.500'. Use the C parser to write a file back unchanged.
+TEXT_COLUMNS = ['_gts', 'created_at']
+
+GTS_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Rows per chunk when streaming oversized CSV files
+CHUNK_ROWS = 1000000
+
+try:
+    import pyarrow  # noqa: F401
+    DEFAULT_ENGINE = 'pyarrow'
+except ImportError:
+    DEFAULT_ENGINE = 'c'
+
+def parse_gts(gts, gts_format=GTS_FORMAT):
+    """Parse timestamps with a fixed format, inferring the format only if the first value does not match."""
+    parsed = pd.to_datetime(gts, format=gts_format, errors='coerce')
+    first_valid = gts.first_valid_index()
+    if first_valid is not None and pd.isna(parsed[first_valid]):
+        parsed = pd.to_datetime(gts, errors='coerce')
+    return parsed
+
+def read_telemetry_csv(file_path, usecols=None, compact=True, engine=None, gts_format=None):
+    """
+    Read a telemetry CSV file.
+
+    Parameters:
+    - file_path (str): Path to the CSV file.
+    - usecols (list): Columns to read, all columns when None.
+    - compact (bool): Read the flag and floor columns as int8/int16.
+    - engine (str): 'pyarrow' or 'c', DEFAULT_ENGINE when None.
+    - gts_format (str): Parse _gts with this format when given, otherwise keep it as text.
+
+    Returns:
+    - DataFrame: The requested columns of the file.
+    """
+    engine = engine or DEFAULT_ENGINE
+
+    # The pyarrow parser fails on empty files with a generic ParserError
+    if os.path.getsize(file_path) == 0:
+        raise pd.errors.EmptyDataError("No columns to parse from file")
+
+    dtype = {column: 'str' for column in TEXT_COLUMNS if usecols is None or column in usecols}
+    if compact:
+        dtype.update({column: column_dtype for column, column_dtype in TELEMETRY_DTYPES.items()
+                      if usecols is None or column in usecols})
+
+    try:
+        with warnings.catch_warnings():
+            # The C parser warns before failing on missing values in integer columns
+            warnings.simplefilter('ignore', RuntimeWarning)
+            df = pd.read_csv(file_path, usecols=usecols, dtype=dtype, engine=engine)
+    except pd.errors.EmptyDataError:
+        raise
+    except (ValueError, TypeError, OverflowError):
+        # Missing or out-of-range values in a compact column: re-read with the C parser,
+        # which leaves numeric columns to its own inference (the pyarrow parser casts
+        # every column once any dtype mapping is passed, and fails the same way again)
+        dtype = {column: column_dtype for column, column_dtype in dtype.items() if column in TEXT_COLUMNS}
+        df = pd.read_csv(file_path, usecols=usecols, dtype=dtype or None, engine='c')
+
+    if gts_format and '_gts' in df.columns:
+        df['_gts'] = parse_gts(df['_gts'], gts_format)
+
+    return df
+
+def should_stream(file_path, threshold_mb, chunk_rows):
+    """Whether a file is large enough to be streamed in chunks instead of read whole."""
+    return bool(chunk_rows) and bool(threshold_mb) and os.path.getsize(file_path) > threshold_mb * 1024 * 1024
+
+def unify_dtypes(dtypes):
+    """Dtype pandas infers for a whole column from the dtypes inferred for each of its chunks."""
+    if all(dtype == dtypes[0] for dtype in dtypes):
+        return dtypes[0]
+    # A column with text in any chunk is read as text throughout
+    text_dtypes = [dtype for dtype in dtypes if pd.api.types.is_string_dtype(dtype)]
+    if text_dtypes:
+        return text_dtypes[0]
+    if all(pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype) for dtype in dtypes):
+        return np.result_type(*dtypes)
+    return object
+
+def scan_csv_dtypes(file_path, usecols=None, chunk_rows=CHUNK_ROWS):
+    """Find the whole-file dtypes of a CSV file by reading it chunk by chunk."""
+    text_dtype = {column: 'str' for column in TEXT_COLUMNS if usecols is None or column in usecols}
+    chunk_dtypes = {}
+    with pd.read_csv(file_path, usecols=usecols, dtype=text_dtype, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            for column, dtype in chunk.dtypes.items():
+                chunk_dtypes.setdefault(column, []).append(dtype)
+    return {column: unify_dtypes(dtypes) for column, dtypes in chunk_dtypes.items()}
+
+def iter_telemetry_csv(file_path, usecols=None, chunk_rows=CHUNK_ROWS):
+    """
+    Read a telemetry CSV file in chunks of chunk_rows rows.
+
+    The file is scanned once first, so every chunk has the dtypes a whole-file
+    read would give (e.g. a flag column is float in every chunk when any chunk
+    has a missing value). Peak memory stays bounded by the chunk size.
+    """
+    dtype = scan_csv_dtypes(file_path, usecols, chunk_rows)
+    with pd.read_csv(file_path, usecols=usecols, dtype=dtype, chunksize=chunk_rows) as reader:
+        yield from reader
+
+def benchmark(paths, usecols=None):
+    """Compare plain pd.read_csv against read_telemetry_csv on the given CSV files."""
+    candidates = [
+        ('pd.read_csv', lambda path: pd.read_csv(path)),
+        ('loader c', lambda path: read_telemetry_csv(path, usecols=usecols, engine='c')),
+    ]
+    if DEFAULT_ENGINE == 'pyarrow':
+        candidates.append(('loader pyarrow', lambda path: read_telemetry_csv(path, usecols=usecols, engine='pyarrow')))
+
+    print(f"\nBenchmarking {len(paths)} files, columns: {usecols or 'all'}")
+    for name, read in candidates:
+        seconds = 0.0
+        memory = 0
+        for path in paths:
+            start = time.perf_counter()
+            df = read(path)
+            seconds += time.perf_counter() - start
+            memory += int(df.memory_usage(deep=True).sum())
+        print(f"{name:<16} {seconds:8.3f}s {memory / 1024 / 1024:10.2f} MB")
+
+def find_csv_files(path):
+    if os.path.isfile(path):
+        return [path]
+
+    paths = []
+    for root, _, files in os.walk(path):
+        for file in files:
+            if file.lower().endswith('.csv') and os.path.getsize(os.path.join(root, file)) > 0:
+                paths.append(os.path.join(root, file))
+    return paths
+
+if __name__ == "__main__":
+    # Usage: python csv_loader.py <csv file or folder> [column,column,...]
+    if len(sys.argv) < 2:
+        print("Usage: python csv_loader.py <csv file or folder> [column,column,...]")
+        sys.exit(1)
+
+    csv_paths = find_csv_files(sys.argv[1])
+    columns = sys.argv[2].split(',') if len(sys.argv) > 2 else None
+    benchmark(csv_paths, columns)
+    if columns is None:
+        benchmark(csv_paths, ['_mb1s', '_mb2s', '_lfls'])
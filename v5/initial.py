@@ -26,7 +26,6 @@ else:
 
 # List of scripts to execute within the 'DOWNLOAD' directory
 scripts = ['auto_download.py', 'duplicate_check.py', 'organise_jobsite.py', 'data_deduplication.py']
-measurement_scripts = ['brake_count.py', 'door_count.py', 'floor_count.py', 'mode_floor_count.py', 'mileage_floor.py']
 
 REQUIRED_JSON_FILES = ['dir.json', 'DOWNLOAD/JSON/dir.json', 'MEASUREMENT/JSON/dir.json',
                        'DOWNLOAD/JSON/csv_path_link.json', 'DOWNLOAD/JSON/file_path.json', 
@@ -112,8 +111,8 @@ def execute_measurement():
         
         try:
             if selector == '0':
-                for measurement_script in measurement_scripts:
-                    execute_script(measurement_script)
+                # Reads each CSV once for all measurement tools
+                execute_script('measure_all.py')
             elif selector == '1':
                 execute_script('brake_count.py')
             elif selector == '2':
@@ -210,11 +209,12 @@ def main():
         print("3. Run duplicate_check.py only")
         print("4. Run organise_jobsite.py only")
         print("5. Run data_deduplication.py only")
+        print("6. Run all scripts as a pipeline")
         print("0. Run MEASUREMENT")
         print("g. Run GRAPH")
         print("e. Exit program")
         
-        selector = input("\nSelect an option (1-5 or 0 or g or e): ").strip().lower()
+        selector = input("\nSelect an option (1-6 or 0 or g or e): ").strip().lower()
         
         try:
             if selector == '1':
@@ -234,6 +234,9 @@ def main():
             elif selector == '5':
                 execute_script('data_deduplication.py')
                 clear_screen()
+            elif selector == '6':
+                execute_script('pipeline.py')
+                clear_screen()
             elif selector == '0':
                 execute_measurement()
             elif selector == 'g':
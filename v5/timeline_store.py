@@ -0,0 +1,309 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+
+from csv_loader import read_telemetry_csv, GTS_FORMAT
+
+# Binary timeline store of the deduplicated telemetry of each lift.
+# Every column is a raw array file that is memory-mapped on read, with all
+# rows ordered by _gts, so any date range is found by binary search and
+# returned as views of the mapped files without parsing a single CSV.
+#
+# <store>/<LIFT>/meta.json   rows, source files and their row counts
+# <store>/<LIFT>/<column>.bin one array per column, meta.json rows long
+#
+# A rewrite of the whole lift writes a new generation of column files
+# (<column>.<generation>.bin) next to the old one and only switches to it
+# when meta.json is replaced, so an interrupted rewrite leaves the old
+# generation in use.
+
+# Stored dtype of each column; _gts is kept as nanoseconds since the epoch
+TIMELINE_COLUMNS = {
+    '_gts': 'int64',
+    '_mb1s': 'int8',
+    '_mb2s': 'int8',
+    '_lfls': 'int16',
+    '_lds': 'int8',
+}
+
+# Id of the source file of each row, so a changed file can be replaced
+FILE_COLUMN = '_file'
+FILE_DTYPE = 'int32'
+
+META_FILE = 'meta.json'
+
+def lift_store_dir(store_root, lift_name):
+    return os.path.join(store_root, lift_name)
+
+def column_path(lift_dir, column, generation=0):
+    if generation == 0:
+        return os.path.join(lift_dir, f'{column}.bin')
+    return os.path.join(lift_dir, f'{column}.{generation}.bin')
+
+def stored_dtypes():
+    return dict(TIMELINE_COLUMNS, **{FILE_COLUMN: FILE_DTYPE})
+
+def load_meta(lift_dir):
+    """Load meta.json of a lift, an empty store when it does not exist."""
+    path = os.path.join(lift_dir, META_FILE)
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            try:
+                return json.load(file)
+            except json.JSONDecodeError:
+                print(f"\n{path} existed but unable to load files. Rebuilding the store.")
+    return {'rows': 0, 'next_id': 0, 'files': {}, 'generation': 0}
+
+def save_meta(lift_dir, meta):
+    """Write meta.json last, so the column files never hold fewer rows than it records."""
+    path = os.path.join(lift_dir, META_FILE)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(meta, file, indent=4)
+    os.replace(path + '.tmp', path)
+
+def file_digest(file_path):
+    hasher = hashlib.blake2b()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def is_unchanged(record, file_path):
+    """Whether a CSV file still holds the rows recorded for it, hashing it only when its mtime changed."""
+    stat = os.stat(file_path)
+    if record['size'] != stat.st_size:
+        return False
+    if record['mtime'] == stat.st_mtime_ns:
+        return True
+    if record['digest'] == file_digest(file_path):
+        # Rewritten with the same content, e.g. by deduplicating it again
+        record['mtime'] = stat.st_mtime_ns
+        return True
+    return False
+
+def columns_intact(lift_dir, meta):
+    """Whether every column file of the generation in meta holds at least the rows it records."""
+    generation = meta.get('generation', 0)
+    for column, dtype in stored_dtypes().items():
+        path = column_path(lift_dir, column, generation)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < meta['rows'] * np.dtype(dtype).itemsize:
+            return False
+    return True
+
+def remove_stale_columns(lift_dir, generation):
+    """Remove column files of other generations, e.g. left by an interrupted rewrite."""
+    current = {os.path.basename(column_path(lift_dir, column, generation)) for column in stored_dtypes()}
+    for filename in os.listdir(lift_dir):
+        if (filename.endswith('.bin') or filename.endswith('.bin.tmp')) and filename not in current:
+            os.remove(os.path.join(lift_dir, filename))
+
+def read_columns(lift_dir, meta, mode='r'):
+    """Memory-map the first rows of every column file of a lift."""
+    rows = meta['rows']
+    columns = {}
+    for column, dtype in stored_dtypes().items():
+        if rows == 0:
+            columns[column] = np.empty(0, dtype=dtype)
+        else:
+            columns[column] = np.memmap(column_path(lift_dir, column, meta.get('generation', 0)),
+                                        dtype=dtype, mode=mode, shape=(rows,))
+    return columns
+
+def read_csv_columns(file_path, file_id):
+    """Read the timeline columns of a CSV file, ordered by _gts and without unparsable timestamps."""
+    try:
+        df = read_telemetry_csv(file_path, usecols=list(TIMELINE_COLUMNS), gts_format=GTS_FORMAT)
+    except pd.errors.EmptyDataError:
+        # Recorded with no rows, so it is not read again on every sync
+        return {column: np.empty(0, dtype=dtype) for column, dtype in stored_dtypes().items()}
+    df = df.dropna(subset=['_gts'])
+    df = df.sort_values('_gts', kind='stable')
+
+    columns = {'_gts': df['_gts'].to_numpy(dtype='datetime64[ns]').view('int64')}
+    for column, dtype in TIMELINE_COLUMNS.items():
+        if column != '_gts':
+            columns[column] = df[column].fillna(0).to_numpy().astype(dtype)
+    columns[FILE_COLUMN] = np.full(len(df), file_id, dtype=FILE_DTYPE)
+    return columns
+
+def append_columns(lift_dir, generation, rows, new_columns):
+    """Append rows after the first rows of every column file, dropping anything an interrupted run left."""
+    for column, dtype in stored_dtypes().items():
+        path = column_path(lift_dir, column, generation)
+        with open(path, 'ab') as f:
+            f.truncate(rows * np.dtype(dtype).itemsize)
+            new_columns[column].astype(dtype).tofile(f)
+
+def rewrite_columns(lift_dir, generation, columns):
+    """
+    Write every column file again as a new generation, e.g. after an out of
+    order file was merged in. The old generation stays in use until meta.json
+    records the new one.
+    """
+    for column, dtype in stored_dtypes().items():
+        columns[column].astype(dtype).tofile(column_path(lift_dir, column, generation))
+
+def sync_lift(csv_folder, store_root, lift_name):
+    """
+    Bring the store of a lift up to date with the CSV files of its folder.
+
+    Files later than everything stored are appended to the column files.
+    Changed, removed or earlier files make the whole lift be merged and
+    written again, still in one pass however many files changed.
+
+    Returns:
+    - dict: Number of 'added', 'replaced' and 'removed' files.
+    """
+    lift_dir = lift_store_dir(store_root, lift_name)
+    os.makedirs(lift_dir, exist_ok=True)
+    meta = load_meta(lift_dir)
+    meta.setdefault('generation', 0)
+    if not columns_intact(lift_dir, meta):
+        print(f"The {lift_name} timeline does not match its meta.json. Rebuilding the store.")
+        meta = {'rows': 0, 'next_id': 0, 'files': {}, 'generation': meta['generation'] + 1}
+    remove_stale_columns(lift_dir, meta['generation'])
+
+    csv_files = sorted(filename for filename in os.listdir(csv_folder) if filename.endswith('.csv'))
+    removed = [filename for filename in meta['files'] if filename not in csv_files]
+    replaced = []
+    added = []
+    for filename in csv_files:
+        record = meta['files'].get(filename)
+        if record is None:
+            added.append(filename)
+        elif not is_unchanged(record, os.path.join(csv_folder, filename)):
+            replaced.append(filename)
+
+    # Rows of changed and removed files are dropped before the new rows are merged in
+    dropped_ids = [meta['files'][filename]['id'] for filename in replaced + removed]
+    for filename in replaced + removed:
+        del meta['files'][filename]
+
+    new_parts = []
+    for filename in added + replaced:
+        file_path = os.path.join(csv_folder, filename)
+        file_id = meta['next_id']
+        meta['next_id'] += 1
+        try:
+            part = read_csv_columns(file_path, file_id)
+        except Exception as e:
+            print(f"Skipping {filename} for the {lift_name} timeline: {e}")
+            continue
+
+        stat = os.stat(file_path)
+        gts = part['_gts']
+        meta['files'][filename] = {
+            'id': file_id,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'digest': file_digest(file_path),
+            'rows': len(gts),
+            'first_gts': str(pd.Timestamp(gts[0])) if len(gts) else None,
+            'last_gts': str(pd.Timestamp(gts[-1])) if len(gts) else None,
+        }
+        new_parts.append(part)
+
+    if new_parts:
+        new_columns = {column: np.concatenate([part[column] for part in new_parts]) for column in stored_dtypes()}
+        order = np.argsort(new_columns['_gts'], kind='stable')
+        new_columns = {column: values[order] for column, values in new_columns.items()}
+    else:
+        new_columns = {column: np.empty(0, dtype=dtype) for column, dtype in stored_dtypes().items()}
+
+    rows = meta['rows']
+    stored = read_columns(lift_dir, meta)
+    in_order = rows == 0 or len(new_columns['_gts']) == 0 or new_columns['_gts'][0] >= stored['_gts'][-1]
+
+    if not dropped_ids and in_order:
+        # Close the mapped files first, they cannot be resized while mapped on Windows
+        del stored
+        append_columns(lift_dir, meta['generation'], rows, new_columns)
+    else:
+        # Merge in memory, then write the columns again in time order
+        keep = ~np.isin(stored[FILE_COLUMN], dropped_ids)
+        merged = {column: np.concatenate((stored[column][keep], new_columns[column]))
+                  for column in stored_dtypes()}
+        del stored
+        order = np.argsort(merged['_gts'], kind='stable')
+        meta['generation'] += 1
+        rewrite_columns(lift_dir, meta['generation'], {column: values[order] for column, values in merged.items()})
+
+    meta['rows'] = int(sum(record['rows'] for record in meta['files'].values()))
+    save_meta(lift_dir, meta)
+    # The previous generation is no longer referenced once meta.json is replaced
+    remove_stale_columns(lift_dir, meta['generation'])
+
+    return {'added': len(added), 'replaced': len(replaced), 'removed': len(removed)}
+
+def sync_store(csv_base_folder, store_root):
+    """Sync the store of every lift folder under the deduplicated CSV folder."""
+    for lift_name in sorted(os.listdir(csv_base_folder)):
+        csv_folder = os.path.join(csv_base_folder, lift_name)
+        if not os.path.isdir(csv_folder):
+            continue
+        try:
+            changes = sync_lift(csv_folder, store_root, lift_name)
+            print(f"Timeline of {lift_name}: {changes['added']} added, {changes['replaced']} replaced, "
+                  f"{changes['removed']} removed")
+        except Exception as e:
+            print(f"An error occurred while updating the timeline of {lift_name}: {e}")
+
+def open_timeline(store_root, lift_name):
+    """Memory-map every column of a lift, in time order."""
+    lift_dir = lift_store_dir(store_root, lift_name)
+    meta = load_meta(lift_dir)
+    if not columns_intact(lift_dir, meta):
+        raise ValueError(f"The {lift_name} timeline does not match its meta.json, sync the store again")
+    return read_columns(lift_dir, meta)
+
+def to_gts_value(timestamp):
+    return pd.Timestamp(timestamp).value
+
+def read_range(store_root, lift_name, start=None, end=None):
+    """
+    Rows of a lift with start <= _gts < end, as views of the memory-mapped columns.
+
+    Parameters:
+    - store_root (str): Path to the timeline store.
+    - lift_name (str): Name of the lift.
+    - start, end: Anything pd.Timestamp accepts; None leaves that side open.
+
+    Returns:
+    - dict: Array of each column, with _gts as datetime64[ns].
+    """
+    columns = open_timeline(store_root, lift_name)
+    gts = columns['_gts']
+    lo = 0 if start is None else int(np.searchsorted(gts, to_gts_value(start), side='left'))
+    hi = len(gts) if end is None else int(np.searchsorted(gts, to_gts_value(end), side='left'))
+
+    rows = {column: values[lo:hi] for column, values in columns.items() if column != FILE_COLUMN}
+    rows['_gts'] = rows['_gts'].view('datetime64[ns]')
+    return rows
+
+def read_range_frame(store_root, lift_name, start=None, end=None):
+    """Rows of a lift in a date range as a DataFrame (copied out of the memory-mapped files)."""
+    return pd.DataFrame(read_range(store_root, lift_name, start, end))
+
+if __name__ == "__main__":
+    # Usage: python timeline_store.py sync <deduplicated CSV folder> <store folder>
+    #        python timeline_store.py range <store folder> <lift> [start] [end]
+    if len(sys.argv) >= 4 and sys.argv[1] == 'sync':
+        sync_store(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) >= 4 and sys.argv[1] == 'range':
+        start_time = time.perf_counter()
+        rows = read_range(sys.argv[2], sys.argv[3],
+                          sys.argv[4] if len(sys.argv) > 4 else None,
+                          sys.argv[5] if len(sys.argv) > 5 else None)
+        seconds = time.perf_counter() - start_time
+        print(f"{len(rows['_gts'])} rows of {sys.argv[3]} in {seconds:.4f}s")
+        if len(rows['_gts']):
+            print(f"From {rows['_gts'][0]} to {rows['_gts'][-1]}")
+    else:
+        print("Usage: python timeline_store.py sync <deduplicated CSV folder> <store folder>")
+        print("       python timeline_store.py range <store folder> <lift> [start] [end]")
+        sys.exit(1)